@@ -0,0 +1,223 @@
+"""
+End-to-end benchmarks of OOINet and the Pioneer plotting pipeline against
+the local fake M2M/THREDDS server, so they are reproducible offline and
+unaffected by the load on the real servers:
+
+    crawl     crawl the sensor inventory and look up the English names
+    download  download the netCDF files of a request from the file server
+    opendap   load the files of a request over OpenDAP (load_netCDF_files)
+    stream    load the files of a request into memory (stream_netCDF_files)
+    pioneer   run one cold cycle of pioneer_plots: request, poll, load,
+              merge, and render the figures
+
+Reports the median and p90/p99 wall time of each scenario, its throughput,
+and the latency percentiles of the HTTP calls it made, e.g.
+
+    python benchmarks/bench_pipeline.py --latency 0.02 --error-rate 0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import datetime
+import numpy as np
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CODE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_server import FakeOOIServer, INVENTORY, synthetic_inventory  # noqa
+from utils import OOINet  # noqa
+
+SCENARIOS = ["crawl", "download", "opendap", "stream", "pioneer"]
+
+REFDES = "CP01CNSM-SBD11-06-METBKA000"
+METHOD = "telemetered"
+STREAM = "metbk_a_dcl_instrument"
+
+
+def percentiles(values):
+    """Return the p50, p90, and p99 of a list of values."""
+    if len(values) == 0:
+        return {"p50": None, "p90": None, "p99": None}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"p50": p50, "p90": p90, "p99": p99}
+
+
+def record_requests(OOI, latencies):
+    """Record the latency of every HTTP call OOINet makes."""
+    request = OOI._request
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return request(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    OOI._request = timed
+    return OOI
+
+
+def request_files(OOI):
+    """Request the benchmark stream and return its netCDF files."""
+    thredds_url = OOI.get_thredds_url(REFDES, METHOD, STREAM)
+    catalog = OOI.get_thredds_catalog(thredds_url)
+    return OOI.parse_catalog(catalog, exclude=["ENG", "gps"])
+
+
+def bench_crawl(OOI, server, workdir):
+    datasets = OOI.search_datasets(English_names=True)
+    return len(datasets), "datasets"
+
+
+def bench_download(OOI, server, workdir, files):
+    save_dir = tempfile.mkdtemp(dir=workdir)
+    manifest = OOI.download_netCDF_files(files, save_dir=save_dir)
+    shutil.rmtree(save_dir)
+    return int(manifest["size"].sum()), "bytes"
+
+
+def bench_opendap(OOI, server, workdir, files):
+    ds = OOI.load_netCDF_files(files).load()
+    return ds.sizes["time"], "records"
+
+
+def bench_stream(OOI, server, workdir, files):
+    ds = OOI.stream_netCDF_files(files)
+    return ds.sizes["time"], "records"
+
+
+def bench_pioneer(OOI, server, workdir):
+    import pioneer_plots
+    from render import Renderer
+    from sync import IncrementalSync
+
+    basePath = tempfile.mkdtemp(dir=workdir)
+    sync = IncrementalSync(OOI, f"{basePath}/data",
+                           window=datetime.timedelta(hours=48))
+    renderer = Renderer(max_workers=2)
+    try:
+        errors = pioneer_plots.run(sync, renderer, basePath)
+        if len(errors) > 0:
+            raise RuntimeError(f'{len(errors)} pipeline tasks failed: '
+                               f'{", ".join(sorted(errors))}')
+        figures = [file for file in os.listdir(f"{basePath}/plots")
+                   if file.endswith(".png")]
+    finally:
+        renderer.close()
+        shutil.rmtree(basePath)
+    return len(figures), "figures"
+
+
+def run_scenario(name, args, server, workdir):
+    """Run a scenario repeatedly, returning its timing summary."""
+    latencies = []
+    OOI = record_requests(
+        OOINet("user", "token", m2m_url=server.m2m_url,
+               thredds_server=server.thredds_server),
+        latencies)
+
+    # The loading scenarios share one request, made outside of the timing
+    bench = globals()[f"bench_{name}"]
+    extra = ()
+    if name in ("download", "opendap", "stream"):
+        extra = (request_files(OOI),)
+
+    # Warm up the session, and the server's synthetic files, untimed
+    for _ in range(args.warmup):
+        bench(OOI, server, workdir, *extra)
+    latencies.clear()
+
+    times = []
+    amount, units = 0, None
+    bytes_start = server.bytes_sent
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        amount, units = bench(OOI, server, workdir, *extra)
+        times.append(time.perf_counter() - start)
+    bytes_sent = server.bytes_sent - bytes_start
+
+    summary = percentiles(times)
+    return {
+        "scenario": name,
+        "repeat": args.repeat,
+        "wall": summary,
+        "throughput": amount / summary["p50"],
+        "units": units,
+        "http_calls": len(latencies) / args.repeat,
+        "http_latency": percentiles(latencies),
+        "bytes_per_run": bytes_sent / args.repeat
+    }
+
+
+def print_result(result):
+    wall = result["wall"]
+    http = result["http_latency"]
+    print(f'{result["scenario"]:<9} '
+          f'wall p50 {wall["p50"]:7.3f} s  p90 {wall["p90"]:7.3f} s  '
+          f'p99 {wall["p99"]:7.3f} s  '
+          f'{result["throughput"]:12,.1f} {result["units"]}/s')
+    if http["p50"] is not None:
+        print(f'{"":<9} {result["http_calls"]:.0f} HTTP calls/run, '
+              f'latency p50 {http["p50"]*1000:.1f} ms  '
+              f'p90 {http["p90"]*1000:.1f} ms  '
+              f'p99 {http["p99"]*1000:.1f} ms, '
+              f'{result["bytes_per_run"]/1e6:.2f} MB served/run')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", default=SCENARIOS,
+                        metavar="scenario",
+                        help=f"scenarios to run ({', '.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="untimed runs before the timed runs")
+    parser.add_argument("--records", type=int, default=50000,
+                        help="records per netCDF file")
+    parser.add_argument("--files", type=int, default=4,
+                        help="netCDF files per request")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the server delays every response")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of responses which fail with a 503")
+    parser.add_argument("--job-delay", type=float, default=1.0,
+                        help="seconds before a data request is ready")
+    parser.add_argument("--crawl-arrays", type=int, default=5,
+                        help="synthetic arrays to add to the inventory")
+    parser.add_argument("--output", help="write the results as json")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+
+    inventory = dict(INVENTORY)
+    inventory.update(synthetic_inventory(args.crawl_arrays))
+    server = FakeOOIServer(records_per_file=args.records,
+                           files_per_job=args.files, latency=args.latency,
+                           error_rate=args.error_rate,
+                           job_delay=args.job_delay, inventory=inventory)
+    server.start()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    results = []
+    try:
+        for name in args.scenarios:
+            result = run_scenario(name, args, server, workdir)
+            print_result(result)
+            results.append(result)
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "requests": server.counts,
+                       "results": results}, f, indent=2)
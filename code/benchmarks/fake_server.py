@@ -0,0 +1,675 @@
+"""
+A self-contained stand-in for the OOINet M2M api and the OOI THREDDS server,
+for benchmarking and regression-testing OOINet offline. It serves:
+
+    M2M:     sensor/inv (inventory, metadata, and async data requests),
+             events/deployment/inv, vocab/inv, and parameter (preload)
+    THREDDS: catalog status, catalog.xml, fileServer (with HEAD, Range, and
+             Last-Modified), and a minimal DAP2 dodsC (.dds, .das, .dods)
+
+Data requests create jobs whose netCDF files are synthesized with a
+configurable number of files and records, and which become ready after a
+configurable delay. Every response can be delayed by a fixed latency, and a
+fraction of the M2M and fileServer responses can be failed with a 503.
+
+    server = FakeOOIServer(records_per_file=10000, latency=0.01)
+    server.start()
+    OOI = OOINet("user", "token", m2m_url=server.m2m_url,
+                 thredds_server=server.thredds_server)
+"""
+import os
+import re
+import json
+import time
+import uuid
+import random
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+
+# The Pioneer streams used by pioneer_plots, by array/node/instrument
+INVENTORY = {
+    "CP01CNSM": {
+        "SBD11": {"06-METBKA000": {"telemetered": ["metbk_a_dcl_instrument"]}},
+        "SBD12": {"05-WAVSSA000": {"telemetered": ["wavss_a_dcl_statistics"]}}
+    },
+    "CP03ISSM": {
+        "SBD11": {"06-METBKA000": {"telemetered": ["metbk_a_dcl_instrument"]}}
+    },
+    "CP04OSSM": {
+        "SBD11": {"06-METBKA000": {"telemetered": ["metbk_a_dcl_instrument"]}}
+    }
+}
+
+# The variables of each stream, with their long names and units
+STREAM_VARIABLES = {
+    "metbk_a_dcl_instrument": {
+        "sea_surface_temperature": ("Sea Surface Temperature", "degC"),
+        "met_salsurf": ("Sea Surface Salinity", "1"),
+        "northward_wind_velocity": ("Northward Wind Velocity", "m s-1"),
+        "eastward_wind_velocity": ("Eastward Wind Velocity", "m s-1"),
+        "barometric_pressure": ("Barometric Pressure", "mbar"),
+        "relative_humidity": ("Relative Humidity", "%")
+    },
+    "wavss_a_dcl_statistics": {
+        "significant_wave_height": ("Significant Wave Height", "m"),
+        "peak_wave_period": ("Peak Wave Period", "s")
+    }
+}
+DEFAULT_VARIABLES = {"value": ("Value", "1")}
+
+NTP_EPOCH = pd.Timestamp("1900-01-01")
+
+DAP_TYPES = {
+    "int32": ("Int32", ">i4"),
+    "float64": ("Float64", ">f8")
+}
+
+
+def synthetic_inventory(arrays, nodes=4, instruments=5):
+    """Build a synthetic inventory to make crawls larger."""
+    inventory = {}
+    for a in range(arrays):
+        array = f"XX{a:02d}SYNT"
+        inventory[array] = {}
+        for n in range(nodes):
+            node = f"MFD{n:02d}"
+            inventory[array][node] = {}
+            for i in range(instruments):
+                instrument = f"{i:02d}-CTDBPC{i:03d}"
+                inventory[array][node][instrument] = {
+                    "telemetered": ["ctdbp_cdef_dcl_instrument"],
+                    "recovered_host": ["ctdbp_cdef_dcl_instrument_recovered"]
+                }
+    return inventory
+
+
+def write_netCDF(arrays, attrs):
+    """Write obs-dimensioned arrays to a netCDF4 file and return its bytes."""
+    import netCDF4
+    fd, path = tempfile.mkstemp(suffix=".nc")
+    os.close(fd)
+    try:
+        with netCDF4.Dataset(path, "w") as nc:
+            nc.createDimension("obs", len(arrays["obs"][0]))
+            for name, (values, var_attrs) in arrays.items():
+                var = nc.createVariable(name, values.dtype, ("obs",))
+                var[:] = values
+                var.setncatts(var_attrs)
+            nc.setncatts(attrs)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+class FakeOOIServer():
+    """
+    A fake OOINet M2M and THREDDS server running in a background thread.
+
+        Args:
+            records_per_file (int): the number of records in each file
+            files_per_job (int): the number of netCDF files of each request
+            latency (float): seconds to delay every response
+            error_rate (float): the fraction of M2M and fileServer responses
+                to fail with a 503 (DAP responses never fail, since the
+                netCDF library doesn't retry)
+            job_delay (float): seconds before a data request is ready
+            deployments (int): the number of deployments of each instrument
+            inventory (dict): Optional. The array/node/instrument/method/
+                stream inventory. Defaults to the Pioneer streams.
+            seed (int): the seed of the random data and errors
+    """
+
+    def __init__(self, records_per_file=10000, files_per_job=2, latency=0.0,
+                 error_rate=0.0, job_delay=1.0, deployments=3,
+                 inventory=None, seed=0):
+
+        self.records_per_file = records_per_file
+        self.files_per_job = files_per_job
+        self.latency = latency
+        self.error_rate = error_rate
+        self.job_delay = job_delay
+        self.deployments = deployments
+        self.inventory = inventory if inventory is not None else INVENTORY
+        self.random = random.Random(seed)
+        self.seed = seed
+
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.bytes_sent = 0
+        self.httpd = None
+        self.thread = None
+        self.writer = None
+
+    # ==========================================================
+    # Server lifecycle
+    def start(self, host="127.0.0.1", port=0):
+        """Start serving in a background thread, returning the base url."""
+        server = self
+
+        class Handler(FakeOOIHandler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        """Stop the server."""
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self.writer is not None:
+            self.writer.shutdown()
+            self.writer = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def m2m_url(self):
+        return self.base_url + "/api/m2m"
+
+    @property
+    def thredds_server(self):
+        return self.base_url + "/thredds/"
+
+    def count(self, endpoint):
+        """Count a request to an endpoint."""
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    # ==========================================================
+    # M2M api
+    def lookup(self, parts):
+        """Walk the inventory along the given path parts."""
+        node = self.inventory
+        for part in parts:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def metadata(self, array, node, instrument):
+        streams = self.lookup([array, node, instrument]) or {}
+        times = []
+        parameters = []
+        for method, stream_list in streams.items():
+            for stream in stream_list:
+                times.append({
+                    "stream": stream,
+                    "method": method,
+                    "beginTime": "2020-01-01T00:00:00.000Z",
+                    "endTime": pd.Timestamp.utcnow().strftime(
+                        "%Y-%m-%dT%H:%M:%S.000Z")
+                })
+                variables = STREAM_VARIABLES.get(stream, DEFAULT_VARIABLES)
+                for i, (name, (long_name, units)) in \
+                        enumerate(variables.items()):
+                    parameters.append({
+                        "pdId": f"PD{abs(hash(name)) % 9000 + 1000}",
+                        "particleKey": name,
+                        "stream": stream,
+                        "units": units,
+                        "type": "float",
+                        "shape": "SCALAR"
+                    })
+        return {"times": times, "parameters": parameters}
+
+    def deployment_records(self, array, node, instrument, number):
+        start = pd.Timestamp("2018-01-01")
+        records = []
+        for n in range(1, self.deployments + 1):
+            if number not in (-1, n):
+                continue
+            begin = start + pd.Timedelta(days=180*(n - 1))
+            end = begin + pd.Timedelta(days=180)
+            records.append({
+                "deploymentNumber": n,
+                "location": {"depth": 1.0, "latitude": 40.13,
+                             "longitude": -70.78},
+                "eventStartTime": int(begin.value // 10**6),
+                "eventStopTime": (None if n == self.deployments
+                                  else int(end.value // 10**6)),
+                "deployCruiseInfo": {"uniqueCruiseIdentifier": f"AR{n:02d}"},
+                "recoverCruiseInfo": None
+            })
+        return records
+
+    def vocab(self, array, node, instrument):
+        return [{
+            "refdes": "-".join((array, node, instrument)),
+            "tocL1": "Coastal Pioneer",
+            "tocL2": f"{array} Mooring",
+            "tocL3": f"{node} Node",
+            "instrument": f"{instrument} Instrument"
+        }]
+
+    def create_job(self, array, node, instrument, method, stream, params):
+        """Create an asynchronous data request and its synthetic files."""
+        end = pd.Timestamp.utcnow().tz_localize(None)
+        if "endDT" in params:
+            end = pd.to_datetime(params["endDT"]).tz_localize(None)
+        begin = end - pd.Timedelta(days=2)
+        if "beginDT" in params:
+            begin = pd.to_datetime(params["beginDT"]).tz_localize(None)
+
+        job_id = f"ooi/user/{uuid.uuid4().hex}"
+        refdes = "-".join((array, node, instrument))
+        edges = pd.date_range(begin, end, periods=self.files_per_job + 1)
+        files = {}
+        for i in range(self.files_per_job):
+            name = (f"deployment{self.deployments:04d}_{refdes}-{method}-"
+                    f"{stream}_{edges[i]:%Y%m%dT%H%M%S}-"
+                    f"{edges[i+1]:%Y%m%dT%H%M%S}.nc")
+            files[name] = {
+                "begin": edges[i],
+                "end": edges[i+1],
+                "id": f"{refdes}-{method}-{stream}",
+                "stream": stream,
+                "seed": self.seed + i,
+                "arrays": None,
+                "bytes": None,
+                "lock": threading.Lock()
+            }
+
+        with self.lock:
+            self.jobs[job_id] = {
+                "ready": time.time() + self.job_delay,
+                "modified": time.time(),
+                "files": files
+            }
+
+        thredds_url = (self.thredds_server + "catalog/" + job_id +
+                       "/catalog.html")
+        return {
+            "requestUUID": job_id.split("/")[-1],
+            "outputURL": thredds_url,
+            "allURLs": [thredds_url,
+                        self.base_url + "/async_results/" + job_id],
+            "sizeCalculation": 1000,
+            "timeCalculation": 60,
+            "numberOfSubJobs": 1
+        }
+
+    # ==========================================================
+    # THREDDS
+    def get_file(self, job_id, name):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        return job["files"].get(name)
+
+    def file_arrays(self, f):
+        """Synthesize (once) the variables of a file."""
+        with f["lock"]:
+            if f["arrays"] is None:
+                n = self.records_per_file
+                rng = np.random.default_rng(f["seed"])
+                # Evenly spaced times from the start (inclusive) to the end
+                begin = (f["begin"] - NTP_EPOCH) / pd.Timedelta(seconds=1)
+                end = (f["end"] - NTP_EPOCH) / pd.Timedelta(seconds=1)
+                seconds = begin + (end - begin) * np.arange(n) / n
+                arrays = {
+                    "obs": (np.arange(n, dtype="int32"), {}),
+                    "time": (np.asarray(seconds, dtype="float64"), {
+                        "units": "seconds since 1900-01-01 00:00:00",
+                        "standard_name": "time",
+                        "long_name": "time",
+                        "calendar": "gregorian"
+                    })
+                }
+                variables = STREAM_VARIABLES.get(f["stream"],
+                                                 DEFAULT_VARIABLES)
+                phase = np.linspace(0, 4*np.pi, n)
+                for i, (name, (long_name, units)) in \
+                        enumerate(variables.items()):
+                    values = (10 + i + np.sin(phase + i) +
+                              0.1*rng.standard_normal(n))
+                    arrays[name] = (values.astype("float64"),
+                                    {"long_name": long_name, "units": units})
+                f["arrays"] = arrays
+        return f["arrays"]
+
+    def file_bytes(self, f):
+        """Synthesize (once) the netCDF file contents of a file."""
+        arrays = self.file_arrays(f)
+        with f["lock"]:
+            if f["bytes"] is None:
+                # The netCDF and HDF5 libraries aren't thread-safe, and the
+                # server shares its process with the client, so the files
+                # are written by a separate process
+                with self.lock:
+                    if self.writer is None:
+                        self.writer = ProcessPoolExecutor(
+                            max_workers=1,
+                            mp_context=multiprocessing.get_context("spawn"))
+                f["bytes"] = self.writer.submit(write_netCDF, arrays,
+                                                {"id": f["id"]}).result()
+        return f["bytes"]
+
+    def catalog_xml(self, job_id):
+        job = self.jobs[job_id]
+        modified = pd.Timestamp(job["modified"], unit="s")
+        datasets = []
+        for name, f in job["files"].items():
+            size = self.records_per_file * 8 * (
+                2 + len(STREAM_VARIABLES.get(f["stream"], DEFAULT_VARIABLES)))
+            datasets.append(
+                f'    <dataset name="{name}" ID="{job_id}/{name}" '
+                f'urlPath="{job_id}/{name}">\n'
+                f'      <dataSize units="Kbytes">{size/1e3:.1f}</dataSize>\n'
+                f'      <date type="modified">'
+                f'{modified:%Y-%m-%dT%H:%M:%SZ}</date>\n'
+                f'    </dataset>')
+        datasets.append(f'    <dataset name="status.txt" '
+                        f'ID="{job_id}/status.txt" '
+                        f'urlPath="{job_id}/status.txt"/>')
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/'
+            'InvCatalog/v1.0" version="1.0.1">\n'
+            '  <service name="all" serviceType="Compound" base=""/>\n'
+            f'  <dataset name="{job_id}" ID="{job_id}">\n'
+            + "\n".join(datasets) +
+            '\n  </dataset>\n</catalog>\n').encode()
+
+    def dds(self, f, name, projection):
+        arrays = self.file_arrays(f)
+        lines = ["Dataset {"]
+        for var, (start, stride, stop) in projection:
+            values = arrays[var][0]
+            count = len(range(start, stop + 1, stride))
+            lines.append(f"    {DAP_TYPES[values.dtype.name][0]} "
+                         f"{var}[obs = {count}];")
+        lines.append(f"}} {name};")
+        return "\n".join(lines) + "\n"
+
+    def das(self, f):
+        arrays = self.file_arrays(f)
+        lines = ["Attributes {"]
+        for var, (values, attrs) in arrays.items():
+            lines.append(f"    {var} {{")
+            for key, value in attrs.items():
+                lines.append(f'        String {key} "{value}";')
+            lines.append("    }")
+        lines.append("    NC_GLOBAL {")
+        lines.append(f'        String id "{f["id"]}";')
+        lines.append("    }")
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+    def parse_projection(self, f, query):
+        """Parse a DAP2 constraint expression into (var, hyperslab) pairs."""
+        arrays = self.file_arrays(f)
+        n = len(arrays["obs"][0])
+        projection = []
+        query = unquote(query)
+        if not query:
+            return [(var, (0, 1, n - 1)) for var in arrays]
+        for item in query.split(","):
+            match = re.match(r"^([\w.]+)((?:\[[^\]]*\])*)$", item.strip())
+            if match is None or match.group(1) not in arrays:
+                raise KeyError(item)
+            start, stride, stop = 0, 1, n - 1
+            if match.group(2):
+                parts = match.group(2)[1:-1].split("][")[0].split(":")
+                parts = [int(p) for p in parts]
+                if len(parts) == 1:
+                    start = stop = parts[0]
+                elif len(parts) == 2:
+                    start, stop = parts
+                else:
+                    start, stride, stop = parts
+            projection.append((match.group(1), (start, stride, stop)))
+        return projection
+
+    def dods(self, f, name, projection):
+        arrays = self.file_arrays(f)
+        body = [self.dds(f, name, projection).encode(), b"Data:\n"]
+        for var, (start, stride, stop) in projection:
+            values = arrays[var][0][start:stop + 1:stride]
+            dtype = DAP_TYPES[values.dtype.name][1]
+            count = np.array([len(values), len(values)], dtype=">u4")
+            body.append(count.tobytes())
+            body.append(values.astype(dtype).tobytes())
+        return b"".join(body)
+
+
+class FakeOOIHandler(BaseHTTPRequestHandler):
+    """Routes requests to the FakeOOIServer which owns the handler."""
+
+    fake = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type="application/json",
+                  headers=None, head=False):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+            with self.fake.lock:
+                self.fake.bytes_sent += len(body)
+
+    def send_json(self, data):
+        self.send_body(200, json.dumps(data))
+
+    def not_found(self):
+        self.send_body(404, json.dumps({"message": "Not Found"}))
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def handle_request(self, head=False):
+        fake = self.fake
+        if fake.latency > 0:
+            time.sleep(fake.latency)
+        url = urlsplit(self.path)
+        path = url.path
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if path.startswith("/thredds/dodsC/"):
+            fake.count("dodsC")
+            return self.handle_dods(path[len("/thredds/dodsC/"):], url.query)
+
+        if fake.should_fail():
+            fake.count("error")
+            return self.send_body(503, json.dumps({"message": "Busy"}))
+
+        if path.startswith("/api/m2m/"):
+            return self.handle_m2m(path[len("/api/m2m/"):].strip("/"),
+                                   params)
+        if path.startswith("/thredds/catalog/"):
+            fake.count("status")
+            return self.handle_status(params)
+        if path.startswith("/thredds/fileServer/"):
+            fake.count("fileServer")
+            return self.handle_file(path[len("/thredds/fileServer/"):],
+                                    head)
+        if path.startswith("/thredds/") and path.endswith("/catalog.xml"):
+            fake.count("catalog")
+            job_id = path[len("/thredds/"):-len("/catalog.xml")]
+            return self.handle_catalog(job_id)
+        return self.not_found()
+
+    def handle_m2m(self, path, params):
+        fake = self.fake
+        parts = path.split("/")
+        service, parts = "/".join(parts[:3]), parts[3:]
+
+        if service == "12576/sensor/inv":
+            fake.count("inventory")
+            if len(parts) == 4 and parts[3] == "metadata":
+                return self.send_json(fake.metadata(*parts[:3]))
+            if len(parts) == 5:
+                if fake.lookup(parts[:4]) is None or \
+                        parts[4] not in fake.lookup(parts[:4]):
+                    return self.not_found()
+                return self.send_json(fake.create_job(*parts, params))
+            node = fake.lookup(parts)
+            if node is None:
+                return self.not_found()
+            return self.send_json(sorted(node) if isinstance(node, dict)
+                                  else sorted(node))
+
+        if path.startswith("12587/events/deployment/inv"):
+            fake.count("deploy")
+            parts = path.split("/")[4:]
+            if fake.lookup(parts[:3]) is None:
+                return self.send_json([])
+            if len(parts) == 3:
+                return self.send_json(list(range(1, fake.deployments + 1)))
+            return self.send_json(
+                fake.deployment_records(*parts[:3], int(parts[3])))
+
+        if service == "12586/vocab/inv":
+            fake.count("vocab")
+            if len(parts) < 3 or fake.lookup(parts[:3]) is None:
+                return self.send_json([])
+            return self.send_json(fake.vocab(*parts[:3]))
+
+        if path.startswith("12575/parameter/"):
+            fake.count("preload")
+            pid = int(path.split("/")[-1])
+            return self.send_json({"id": pid, "data_level": pid % 3,
+                                   "name": f"parameter_{pid}"})
+
+        return self.not_found()
+
+    def handle_status(self, params):
+        dataset = params.get("dataset", "")
+        job_id = dataset.rsplit("/", 1)[0]
+        job = self.fake.jobs.get(job_id)
+        if job is None or time.time() < job["ready"]:
+            return self.not_found()
+        return self.send_body(200, "Complete", content_type="text/plain")
+
+    def handle_catalog(self, job_id):
+        job = self.fake.jobs.get(job_id)
+        if job is None:
+            return self.not_found()
+        last_modified = formatdate(job["modified"], usegmt=True)
+        since = self.headers.get("If-Modified-Since")
+        if since is not None and \
+                parsedate_to_datetime(since).timestamp() >= \
+                int(job["modified"]):
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        return self.send_body(200, self.fake.catalog_xml(job_id),
+                              content_type="application/xml",
+                              headers={"Last-Modified": last_modified})
+
+    def handle_file(self, path, head):
+        job_id, name = path.rsplit("/", 1)
+        f = self.fake.get_file(job_id, name)
+        if f is None:
+            return self.not_found()
+        data = self.fake.file_bytes(f)
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Last-Modified": formatdate(self.fake.jobs[job_id]["modified"],
+                                        usegmt=True)
+        }
+        # Send the whole file if it changed since the If-Range validator
+        byte_range = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range != headers["Last-Modified"]:
+            byte_range = None
+        if byte_range is not None and not head:
+            start = int(byte_range.split("=")[1].split("-")[0])
+            headers["Content-Range"] = \
+                f"bytes {start}-{len(data) - 1}/{len(data)}"
+            return self.send_body(206, data[start:],
+                                  content_type="application/x-netcdf",
+                                  headers=headers)
+        return self.send_body(200, data, content_type="application/x-netcdf",
+                              headers=headers, head=head)
+
+    def handle_dods(self, path, query):
+        match = re.match(r"^(.*)/([^/]+\.nc)\.(dds|das|dods)$", path)
+        if match is None:
+            return self.not_found()
+        job_id, name, ext = match.groups()
+        f = self.fake.get_file(job_id, name)
+        if f is None:
+            return self.not_found()
+        try:
+            projection = self.fake.parse_projection(f, query)
+        except (KeyError, ValueError):
+            return self.send_body(400, "Error { code = 1001; };\n",
+                                  content_type="text/plain")
+        headers = {"XDODS-Server": "dods/3.2"}
+        if ext == "dds":
+            headers["Content-Description"] = "dods-dds"
+            body = self.fake.dds(f, name, projection)
+            content_type = "text/plain"
+        elif ext == "das":
+            headers["Content-Description"] = "dods-das"
+            body = self.fake.das(f)
+            content_type = "text/plain"
+        else:
+            headers["Content-Description"] = "dods-data"
+            body = self.fake.dods(f, name, projection)
+            content_type = "application/octet-stream"
+        return self.send_body(200, body, content_type=content_type,
+                              headers=headers)
+
+
+if __name__ == '__main__':
+
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Run the fake OOINet M2M and THREDDS server.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--files", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--job-delay", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = FakeOOIServer(records_per_file=args.records,
+                           files_per_job=args.files, latency=args.latency,
+                           error_rate=args.error_rate,
+                           job_delay=args.job_delay)
+    server.start(port=args.port)
+    print(f"M2M api: {server.m2m_url}")
+    print(f"THREDDS: {server.thredds_server}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
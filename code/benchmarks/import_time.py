@@ -0,0 +1,67 @@
+"""
+Benchmark the time it takes to import utils in a fresh interpreter, and
+check that importing it doesn't pull in the heavy scientific stack.
+
+Exits with a non-zero status if a heavy module is imported or the median
+import time is over the limit, so it can guard against regressions:
+
+    python benchmarks/import_time.py --limit 1.5
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+# Modules which must only be imported when first needed
+HEAVY_MODULES = ["xarray", "matplotlib", "netCDF4", "dask", "xml.dom.minidom"]
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import sys, time, json
+start = time.perf_counter()
+import utils
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import(module="utils"):
+    """Import a module in a fresh interpreter and return the result."""
+    snippet = SNIPPET.replace("import utils", f"import {module}")
+    output = subprocess.run([sys.executable, "-c", snippet], cwd=CODE_DIR,
+                            check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--module", default="utils")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=float, default=1.5,
+                        help="maximum median import time in seconds")
+    args = parser.parse_args()
+
+    times = []
+    for _ in range(args.repeat):
+        result = measure_import(args.module)
+        times.append(result["elapsed"])
+    median = statistics.median(times)
+    print(f"import {args.module}: median {median*1000:.0f} ms, "
+          f"min {min(times)*1000:.0f} ms, max {max(times)*1000:.0f} ms")
+
+    failed = False
+    heavy = [module for module in HEAVY_MODULES
+             if module in result["modules"]]
+    if len(heavy) > 0:
+        print(f"FAIL: importing {args.module} imported {', '.join(heavy)}")
+        failed = True
+    if median > args.limit:
+        print(f"FAIL: median import time is over {args.limit} s")
+        failed = True
+
+    sys.exit(1 if failed else 0)
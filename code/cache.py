@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class ResponseCache():
+    """
+    Persistent on-disk cache of OOINet API responses keyed by the request
+    url. Entries are stored in a sqlite database with the time they were
+    stored and last accessed, which is used to expire entries by age and to
+    evict the least recently used entries when the cache exceeds its size cap.
+
+        Args:
+            cache_dir (str): the directory in which to keep the cache database
+            max_size (int): the maximum total size in bytes of the cached
+                responses before the least recently used entries are evicted
+    """
+
+    def __init__(self, cache_dir, max_size=256*1024**2):
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, "responses.sqlite")
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, body TEXT, size INTEGER, "
+                "created REAL, accessed REAL)")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS accessed_idx "
+                "ON responses (accessed)")
+
+    def get(self, url, ttl):
+        """
+        Return the cached response for a url, or None if the url is not in
+        the cache or the cached entry is older than ttl seconds.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT body, created FROM responses WHERE url = ?",
+                (url,)).fetchone()
+            if row is None:
+                return None
+            body, created = row
+            if now - created > ttl:
+                self.conn.execute("DELETE FROM responses WHERE url = ?",
+                                  (url,))
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? "
+                              "WHERE url = ?", (now, url))
+        return json.loads(body)
+
+    def put(self, url, data):
+        """Store the response for a url and evict entries over the cap."""
+        body = json.dumps(data)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (url, body, len(body), now, now))
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used entries until under the cap."""
+        total = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_size:
+            return
+        rows = self.conn.execute(
+            "SELECT url, size FROM responses ORDER BY accessed").fetchall()
+        for url, size in rows:
+            if total <= self.max_size:
+                break
+            self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
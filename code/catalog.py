@@ -0,0 +1,95 @@
+import re
+import xml.etree.ElementTree as ET
+import pandas as pd
+
+
+# Namespace of the THREDDS catalog xml
+THREDDS_NS = "{http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0}"
+
+# Multipliers of the THREDDS dataSize units to bytes
+SIZE_UNITS = {
+    "bytes": 1,
+    "kbytes": 1e3,
+    "mbytes": 1e6,
+    "gbytes": 1e9,
+    "tbytes": 1e12
+}
+
+
+def _local_name(tag):
+    """Strip the xml namespace from a tag."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_catalog(source):
+    """
+    Incrementally parse a THREDDS catalog, yielding each dataset entry as
+    soon as it has been read, without building the whole document in memory.
+
+        Args:
+            source (file-like): a file or stream of the catalog xml
+
+        Yields:
+            entry (dict): the urlPath ("path"), size in bytes ("size"), and
+                modification time ("modified") of each dataset, with None for
+                a size or time which isn't in the catalog
+    """
+    for event, elem in ET.iterparse(source, events=("end",)):
+        if _local_name(elem.tag) != "dataset":
+            continue
+
+        path = elem.get("urlPath")
+        if path is not None:
+            size = None
+            modified = None
+            for child in elem:
+                name = _local_name(child.tag)
+                if name == "dataSize" and child.text:
+                    units = child.get("units", "bytes").lower()
+                    size = int(float(child.text) * SIZE_UNITS.get(units, 1))
+                elif name == "date" and child.get("type") == "modified":
+                    modified = pd.to_datetime(child.text)
+            yield {"path": path, "size": size, "modified": modified}
+
+        # Free the parsed dataset, since it's no longer needed
+        elem.clear()
+
+
+def compile_filter(include=None, exclude=[]):
+    """
+    Compile a single-pass filter for catalog items from keyword lists.
+
+        Args:
+            include (list): Optional. Keywords of which at least one must be
+                in an item for it to be kept.
+            exclude (list): keywords which, if in an item, filter it out
+
+        Returns:
+            keep (callable): a function taking an item and returning True if
+                the item passes the filter
+    """
+    for keywords, name in [(include, "include"), (exclude, "exclude")]:
+        if keywords is None:
+            continue
+        if type(keywords) is not list:
+            raise ValueError(f'arg {name} must be a list')
+        for keyword in keywords:
+            if type(keyword) is not str:
+                raise ValueError(
+                    f'Element {keyword} of {name} must be a string.')
+
+    include_re = None
+    if include:
+        include_re = re.compile("|".join(map(re.escape, include)))
+    exclude_re = None
+    if exclude:
+        exclude_re = re.compile("|".join(map(re.escape, exclude)))
+
+    def keep(item):
+        if include_re is not None and include_re.search(item) is None:
+            return False
+        if exclude_re is not None and exclude_re.search(item) is not None:
+            return False
+        return True
+
+    return keep
@@ -0,0 +1,226 @@
+import weakref
+import threading
+import numpy as np
+
+
+# Standard gravity (m s-2) and the density of seawater (kg m-3)
+GRAVITY = 9.80665
+RHO_SEAWATER = 1025.0
+
+
+class DerivedVariable():
+    """
+    A variable computed from other variables of a dataset.
+
+        Args:
+            name (str): the name of the derived variable
+            inputs (list): the names of the variables it is computed from,
+                which may themselves be derived
+            func (callable): computes the variable from the input
+                xarray.DataArrays, in the order of inputs, with vectorized
+                (numpy ufunc) operations so dask-backed inputs stay lazy
+            attrs (dict): the attributes (long_name, units) of the result
+    """
+
+    def __init__(self, name, inputs, func, attrs):
+        self.name = name
+        self.inputs = list(inputs)
+        self.func = func
+        self.attrs = dict(attrs)
+
+
+class DerivedRegistry():
+    """
+    Registry of the variables which can be derived from OOI datasets. Derived
+    variables are evaluated lazily with vectorized operations, so they stay
+    dask arrays if the dataset is dask-backed, and are memoized per dataset
+    object, so each is computed once per dataset however many times (or
+    through however many other derived variables) it is requested. The
+    memoized results of a dataset are dropped with the dataset.
+    """
+
+    def __init__(self):
+        self.variables = {}
+        # The results of each dataset by id, with a weak reference to the
+        # dataset to check the id isn't reused and to drop the results
+        self.memo = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.variables
+
+    def register(self, name, inputs, **attrs):
+        """
+        Decorate a function to register it as a derived variable:
+
+            @registry.register("wind_speed", ["eastward_wind_velocity",
+                               "northward_wind_velocity"],
+                               long_name="Wind Speed", units="m s-1")
+            def wind_speed(u, v):
+                return np.hypot(u, v)
+        """
+        def decorator(func):
+            self.variables[name] = DerivedVariable(name, inputs, func, attrs)
+            return func
+        return decorator
+
+    def inputs(self, names):
+        """
+        Return the dataset variables needed to derive the given variables,
+        expanding derived inputs recursively.
+        """
+        needed = []
+        for name in names:
+            if name not in self.variables:
+                raise KeyError(f'Unknown derived variable {name}')
+            for variable in self.variables[name].inputs:
+                if variable in self.variables:
+                    needed.extend(self.inputs([variable]))
+                else:
+                    needed.append(variable)
+        return list(dict.fromkeys(needed))
+
+    def available(self, ds):
+        """Return the derived variables which can be computed for ds."""
+        names = []
+        for name in self.variables:
+            try:
+                inputs = self.inputs([name])
+            except KeyError:
+                continue
+            if all(variable in ds.variables for variable in inputs):
+                names.append(name)
+        return names
+
+    def _results(self, ds):
+        """The memoized results of a dataset, by derived variable name."""
+        key = id(ds)
+        with self.lock:
+            entry = self.memo.get(key)
+            if entry is None or entry[0]() is not ds:
+                def forget(ref, key=key):
+                    # Called when the dataset is collected, so the lock
+                    # may already be held by this thread
+                    if self.memo.get(key, (None,))[0] is ref:
+                        self.memo.pop(key, None)
+                entry = (weakref.ref(ds, forget), {})
+                self.memo[key] = entry
+        return entry[1]
+
+    def get(self, ds, name):
+        """
+        Evaluate a derived variable of a dataset, or return the memoized
+        result for the same dataset.
+
+            Args:
+                ds (xarray.Dataset): the dataset, with time as the dimension
+                name (str): the name of the derived variable
+
+            Returns:
+                da (xarray.DataArray): the derived variable
+        """
+        if name in ds.variables:
+            return ds[name]
+        if name not in self.variables:
+            raise KeyError(f'Unknown derived variable {name}')
+
+        results = self._results(ds)
+        with self.lock:
+            if name in results:
+                return results[name]
+
+        variable = self.variables[name]
+        args = [self.get(ds, dependency) for dependency in variable.inputs]
+        da = variable.func(*args)
+        da.name = name
+        da.attrs = dict(variable.attrs)
+
+        with self.lock:
+            results[name] = da
+        return da
+
+    def derive(self, ds, names):
+        """
+        Add derived variables to a dataset.
+
+            Args:
+                ds (xarray.Dataset): the dataset, with time as the dimension
+                names (list): the names of the derived variables to add
+
+            Returns:
+                ds (xarray.Dataset): the dataset with the derived variables
+        """
+        if not names:
+            return ds
+        return ds.assign({name: self.get(ds, name) for name in names})
+
+    def clear(self):
+        """Forget the memoized results."""
+        with self.lock:
+            self.memo.clear()
+
+
+# The process-wide registry of derived variables
+REGISTRY = DerivedRegistry()
+
+
+def derive(ds, names):
+    """Add derived variables from the process-wide registry to a dataset."""
+    return REGISTRY.derive(ds, names)
+
+
+# ==========================================================
+# Meteorological products (METBK)
+@REGISTRY.register("wind_speed",
+                   ["eastward_wind_velocity", "northward_wind_velocity"],
+                   long_name="Wind Speed", units="m s-1")
+def wind_speed(u, v):
+    return np.hypot(u, v)
+
+
+@REGISTRY.register("wind_direction",
+                   ["eastward_wind_velocity", "northward_wind_velocity"],
+                   long_name="Wind Direction (from, clockwise from north)",
+                   units="degrees")
+def wind_direction(u, v):
+    # Meteorological convention: the direction the wind blows from
+    return np.mod(180 + np.degrees(np.arctan2(u, v)), 360)
+
+
+@REGISTRY.register("air_sea_temperature_difference",
+                   ["air_temperature", "sea_surface_temperature"],
+                   long_name="Air-Sea Temperature Difference", units="degC")
+def air_sea_temperature_difference(air, sea):
+    return air - sea
+
+
+@REGISTRY.register("dew_point_temperature",
+                   ["air_temperature", "relative_humidity"],
+                   long_name="Dew Point Temperature", units="degC")
+def dew_point_temperature(air, rh):
+    # Magnus formula over water
+    b, c = 17.62, 243.12
+    gamma = np.log(rh / 100) + b * air / (c + air)
+    return c * gamma / (b - gamma)
+
+
+# ==========================================================
+# Wave products (WAVSS)
+@REGISTRY.register("wave_steepness",
+                   ["significant_wave_height", "peak_wave_period"],
+                   long_name="Wave Steepness", units="1")
+def wave_steepness(height, period):
+    # Significant wave height over the deep-water peak wavelength
+    wavelength = GRAVITY * np.square(period) / (2 * np.pi)
+    return height / wavelength
+
+
+@REGISTRY.register("wave_power",
+                   ["significant_wave_height", "peak_wave_period"],
+                   long_name="Wave Power", units="kW m-1")
+def wave_power(height, period):
+    # Deep-water energy flux, approximating the energy period as 0.9 times
+    # the peak period
+    energy_period = 0.9 * period
+    return (RHO_SEAWATER * GRAVITY**2 / (64 * np.pi) *
+            np.square(height) * energy_period / 1000)
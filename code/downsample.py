@@ -0,0 +1,199 @@
+import numpy as np
+
+
+def _as_float(x):
+    """Convert x values (including datetime64) into floats."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype("int64").astype("float64")
+    return x.astype("float64")
+
+
+def _bucket_starts(x, n_buckets):
+    """
+    Split sorted x values into n_buckets buckets of equal width in x.
+
+        Returns:
+            starts (numpy.ndarray): the index of the first point of each
+                bucket, followed by the number of points
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.view("int64")
+    edges = np.linspace(float(x[0]), float(x[-1]), n_buckets + 1)[1:-1]
+    if x.dtype.kind in "iu":
+        edges = np.ceil(edges).astype(x.dtype)
+    starts = np.empty(n_buckets + 1, dtype="int64")
+    starts[0] = 0
+    starts[1:-1] = np.searchsorted(x, edges)
+    starts[-1] = len(x)
+    return starts
+
+
+def minmax_indices(x, y, n_out):
+    """
+    Select the indices of the minimum and maximum of y in each of n_out/2
+    buckets of equal width in x (i.e. pixel columns), along with the first
+    and last points. Keeps every extreme of the series at the resolution of
+    the buckets, however irregular the sampling. NaNs are never selected.
+
+        Args:
+            x (array): the x values, sorted ascending
+            y (array): the y values
+            n_out (int): the approximate number of points to keep
+
+        Returns:
+            indices (numpy.ndarray): the sorted indices of the points to keep
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+
+    # Exclude NaNs from the minimum and maximum of each bucket, and from
+    # the first and last points
+    low = y
+    high = y
+    ends = [0, n - 1]
+    if y.dtype.kind == "f":
+        finite = np.isfinite(y)
+        if not finite.all():
+            low = np.where(finite, y, np.inf)
+            high = np.where(finite, y, -np.inf)
+            ends = [finite.argmax(), n - 1 - finite[::-1].argmax()]
+
+    starts = _bucket_starts(x, max(n_out // 2, 1))
+    sizes = np.diff(starts)
+    starts = starts[:-1][sizes > 0]
+    sizes = sizes[sizes > 0]
+
+    def first_of_bucket(values, extremes):
+        """The index of the first point of each bucket at its extreme."""
+        positions = np.flatnonzero(values == np.repeat(extremes, sizes))
+        return positions[np.searchsorted(positions, starts)]
+
+    lows = np.minimum.reduceat(low, starts)
+    highs = np.maximum.reduceat(high, starts)
+    # Buckets of only NaNs have infinite extremes, and no points to keep
+    data = np.isfinite(lows) if y.dtype.kind == "f" else slice(None)
+    imin = first_of_bucket(low, lows)[data]
+    imax = first_of_bucket(high, highs)[data]
+
+    indices = np.unique(np.concatenate((imin, imax)))
+    if len(indices) == 0:
+        return indices
+    return np.unique(np.concatenate((ends, indices)))
+
+
+def _gaps(x, indices, n_out):
+    """
+    Find the gaps in the data between consecutive selected points, i.e.
+    buckets of minmax_indices without any data (or only NaNs) which the
+    line of the full series would show as broken.
+
+        Returns:
+            gaps (numpy.ndarray): True for each selected point (but the last)
+                which is followed by a gap
+    """
+    starts = _bucket_starts(x, max(n_out // 2, 1))
+    buckets = np.searchsorted(starts, indices, side="right") - 1
+    return np.diff(buckets) > 1
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Select the indices of the points to keep with the largest-triangle-
+    three-buckets algorithm. The first and last points are kept, and from
+    each bucket in between the point forming the largest triangle with the
+    previously kept point and the average of the next bucket is kept. The
+    triangle areas within each bucket are computed with NumPy; only the walk
+    over the buckets, which depends on the previous choice, is a loop.
+
+        Args:
+            x (array): the x values, sorted ascending
+            y (array): the y values, without NaNs
+            n_out (int): the number of points to keep
+
+        Returns:
+            indices (numpy.ndarray): the sorted indices of the points to keep
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+
+    x = _as_float(x)
+    y = np.asarray(y, dtype="float64")
+
+    # Bucket edges for the points between the first and last
+    edges = np.linspace(1, n - 1, n_out - 1).astype("int64")
+
+    # The average of each bucket, with the last point as the final bucket
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[n - 1])
+    avg_y = np.append(sums_y / counts, y[n - 1])
+
+    indices = np.empty(n_out, dtype="int64")
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        bx = x[start:end]
+        by = y[start:end]
+        # Twice the triangle area between a, each point, and the next average
+        area = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) -
+                      (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+
+    return indices
+
+
+def downsample(x, y, n_out, method="minmax"):
+    """
+    Reduce a series to about n_out points for plotting while preserving its
+    visual shape.
+
+        Args:
+            x (array): the x values (e.g. time), sorted ascending
+            y (array): the y values
+            n_out (int): the number of points to keep, e.g. the width of the
+                figure in pixels
+            method (str): "minmax" for the minimum and maximum per pixel
+                column of x, which keeps every extreme (e.g. peak wind or
+                minimum SST) and a NaN at each pixel column without data,
+                so the line is still broken at gaps, or "lttb" for
+                largest-triangle-three-buckets, which keeps the shape of the
+                series but may drop extremes and drops NaN values
+
+        Returns:
+            x, y (numpy.ndarray): the downsampled series
+    """
+    if method not in ("minmax", "lttb"):
+        raise ValueError(f'Unknown downsampling method {method}')
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= n_out:
+        return x, y
+
+    if method == "minmax":
+        indices = minmax_indices(x, y, n_out)
+        gaps = np.flatnonzero(_gaps(x, indices, n_out))
+        x = x[indices]
+        y = y[indices]
+        if len(gaps) > 0:
+            # Break the line after each point followed by a gap
+            x = np.insert(x, gaps + 1, x[gaps])
+            if y.dtype.kind != "f":
+                y = y.astype("float64")
+            y = np.insert(y, gaps + 1, np.nan)
+        return x, y
+
+    if y.dtype.kind in "fc":
+        mask = np.isfinite(y)
+        if not mask.all():
+            x = x[mask]
+            y = y[mask]
+    indices = lttb_indices(x, y, n_out)
+    return x[indices], y[indices]
@@ -0,0 +1,250 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InventoryIndex():
+    """
+    Locally persisted, searchable index of the OOINet inventory. Holds the
+    reference designators with their English (vocab) names, methods and
+    streams, and deployment numbers in a sqlite database, so that searches
+    are answered without any requests to OOINet. The index is built and
+    updated with InventoryIndex.refresh.
+
+        Args:
+            path (str): the path to the sqlite database of the index
+    """
+
+    COLUMNS = ["array", "array_name", "node", "node_name", "instrument",
+               "instrument_name", "refdes", "url", "deployments"]
+
+    def __init__(self, path):
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS datasets (
+                    refdes TEXT PRIMARY KEY,
+                    array TEXT COLLATE NOCASE,
+                    node TEXT COLLATE NOCASE,
+                    instrument TEXT COLLATE NOCASE,
+                    url TEXT,
+                    array_name TEXT COLLATE NOCASE,
+                    node_name TEXT COLLATE NOCASE,
+                    instrument_name TEXT COLLATE NOCASE);
+                CREATE TABLE IF NOT EXISTS streams (
+                    refdes TEXT, method TEXT, stream TEXT,
+                    PRIMARY KEY (refdes, method, stream));
+                CREATE TABLE IF NOT EXISTS deployments (
+                    refdes TEXT, deploymentNumber INTEGER,
+                    PRIMARY KEY (refdes, deploymentNumber));
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY, value TEXT);
+                CREATE INDEX IF NOT EXISTS array_idx ON datasets (array);
+                CREATE INDEX IF NOT EXISTS node_idx ON datasets (node);
+                CREATE INDEX IF NOT EXISTS instrument_idx
+                    ON datasets (instrument);
+                CREATE INDEX IF NOT EXISTS array_name_idx
+                    ON datasets (array_name);
+                CREATE INDEX IF NOT EXISTS node_name_idx
+                    ON datasets (node_name);
+                CREATE INDEX IF NOT EXISTS instrument_name_idx
+                    ON datasets (instrument_name);
+                CREATE INDEX IF NOT EXISTS stream_idx ON streams (stream);
+            """)
+
+    def refresh(self, ooinet, array=None, max_workers=8):
+        """
+        Build or update the index by crawling OOINet.
+
+            Args:
+                ooinet (OOINet): an initialized OOINet tool
+                array (str): Optional. Only refresh the datasets of this
+                    array. Defaults to the whole inventory.
+                max_workers (int): maximum number of concurrent requests
+
+            Returns:
+                count (int): the number of reference designators indexed
+        """
+        # Crawl the inventory for the reference designators and deployments
+        datasets = ooinet.search_datasets(array=array,
+                                          max_workers=max_workers)
+        refdes_list = list(datasets["refdes"])
+
+        # Get the English names and data streams of each refdes
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            vocabs = list(executor.map(ooinet.get_vocab, refdes_list))
+            streams = list(executor.map(ooinet.get_datastreams, refdes_list))
+
+        dataset_rows = []
+        deployment_rows = []
+        stream_rows = []
+        for row, vocab, stream_df in zip(datasets.itertuples(), vocabs,
+                                         streams):
+            if len(vocab) > 0:
+                array_name = " ".join((vocab["tocL1"].iloc[0],
+                                       vocab["tocL2"].iloc[0]))
+                node_name = vocab["tocL3"].iloc[0]
+                instrument_name = vocab["instrument"].iloc[0]
+            else:
+                array_name, node_name, instrument_name = None, None, None
+            dataset_rows.append((row.refdes, row.array, row.node,
+                                 row.instrument, row.url, array_name,
+                                 node_name, instrument_name))
+            for deployment in row.deployments:
+                deployment_rows.append((row.refdes, int(deployment)))
+            for stream in stream_df.dropna().itertuples():
+                stream_rows.append((row.refdes, stream.method, stream.stream))
+
+        # Replace the indexed records in a single transaction
+        with self.lock, self.conn:
+            if array is None:
+                self.conn.execute("DELETE FROM datasets")
+                self.conn.execute("DELETE FROM streams")
+                self.conn.execute("DELETE FROM deployments")
+            else:
+                for table in ["datasets", "streams", "deployments"]:
+                    self.conn.execute(
+                        f"DELETE FROM {table} WHERE refdes LIKE ?",
+                        (array + "-%",))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO datasets VALUES (?,?,?,?,?,?,?,?)",
+                dataset_rows)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO deployments VALUES (?,?)",
+                deployment_rows)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO streams VALUES (?,?,?)", stream_rows)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('refreshed', ?)",
+                (time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),))
+
+        return len(dataset_rows)
+
+    def _pattern(self, value, prefix):
+        """Build an escaped LIKE pattern for a prefix or substring match."""
+        value = value.replace("\\", "\\\\").replace("%", "\\%")
+        value = value.replace("_", "\\_")
+        if prefix:
+            return value + "%"
+        return "%" + value + "%"
+
+    def search(self, array=None, node=None, instrument=None, name=None,
+               stream=None, prefix=False, English_names=False):
+        """
+        Search the index. All given terms must match, and are matched
+        case-insensitively.
+
+            Args:
+                array (str): partial or full OOI abbreviation of an array
+                node (str): partial or full OOI abbreviation of a node
+                instrument (str): partial or full OOI abbreviation of an
+                    instrument
+                name (str): partial English name of an array, node, or
+                    instrument (e.g. "Central Surface Mooring")
+                stream (str): partial name of a data stream
+                prefix (bool): Set to True to match the terms as prefixes
+                    rather than substrings, which uses the indexes.
+                English_names (bool): Set to True to include the English
+                    names of the array, node, and instrument.
+
+            Returns:
+                datasets (pandas.DataFrame): the matching datasets, in the
+                    same layout as OOINet.search_datasets
+        """
+        clauses = []
+        params = []
+        for column, value in [("array", array), ("node", node),
+                              ("instrument", instrument)]:
+            if value is not None:
+                clauses.append(f"d.{column} LIKE ? ESCAPE '\\'")
+                params.append(self._pattern(value, prefix))
+        if name is not None:
+            clauses.append("(d.array_name LIKE ? ESCAPE '\\' OR "
+                           "d.node_name LIKE ? ESCAPE '\\' OR "
+                           "d.instrument_name LIKE ? ESCAPE '\\')")
+            params.extend([self._pattern(name, prefix)]*3)
+        if stream is not None:
+            clauses.append("d.refdes IN (SELECT refdes FROM streams "
+                           "WHERE stream LIKE ? ESCAPE '\\')")
+            params.append(self._pattern(stream, prefix))
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+        query = f"""
+            SELECT d.array, d.array_name, d.node, d.node_name, d.instrument,
+                   d.instrument_name, d.refdes, d.url,
+                   GROUP_CONCAT(p.deploymentNumber) AS deployments
+            FROM datasets d
+            LEFT JOIN deployments p ON p.refdes = d.refdes
+            {where}
+            GROUP BY d.refdes
+            ORDER BY d.refdes
+        """
+        with self.lock:
+            datasets = pd.read_sql_query(query, self.conn, params=params)
+
+        datasets["deployments"] = [
+            sorted(int(x) for x in deploy.split(",")) if deploy else []
+            for deploy in datasets["deployments"]]
+
+        if not English_names:
+            datasets = datasets.drop(columns=["array_name", "node_name",
+                                              "instrument_name"])
+        return datasets
+
+    def get_datastreams(self, refdes):
+        """Return the indexed methods and streams of a refdes."""
+        with self.lock:
+            return pd.read_sql_query(
+                "SELECT refdes, method, stream FROM streams WHERE refdes = ? "
+                "ORDER BY method, stream", self.conn, params=[refdes])
+
+    def refreshed(self):
+        """Return the time the index was last refreshed, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM meta WHERE key = 'refreshed'").fetchone()
+        return row[0] if row is not None else None
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description="Build or search the local OOINet inventory index.")
+    parser.add_argument("command", choices=["refresh", "search"])
+    parser.add_argument("--index", default="inventory.sqlite",
+                        help="path to the inventory index database")
+    parser.add_argument("--userinfo", default="../user_info.yaml",
+                        help="yaml file with the OOINet apiname and apikey")
+    parser.add_argument("--array")
+    parser.add_argument("--node")
+    parser.add_argument("--instrument")
+    parser.add_argument("--name")
+    parser.add_argument("--stream")
+    parser.add_argument("--prefix", action="store_true")
+    args = parser.parse_args()
+
+    index = InventoryIndex(args.index)
+
+    if args.command == "refresh":
+        import yaml
+        from utils import OOINet
+        userinfo = yaml.safe_load(open(args.userinfo))
+        OOI = OOINet(userinfo['apiname'], userinfo['apikey'])
+        count = index.refresh(OOI, array=args.array)
+        print(f"Indexed {count} reference designators")
+    else:
+        datasets = index.search(array=args.array, node=args.node,
+                                instrument=args.instrument, name=args.name,
+                                stream=args.stream, prefix=args.prefix,
+                                English_names=True)
+        print(datasets.to_string())
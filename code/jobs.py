@@ -0,0 +1,142 @@
+import time
+import threading
+from concurrent.futures import Future
+import numpy as np
+from timestamps import epoch_to_datetime64
+
+
+def _now():
+    """The current UTC time as a datetime64[ns]."""
+    return epoch_to_datetime64(time.time(), unit="s")
+
+
+class _Job():
+    """An asynchronous data request and the window of data it covers."""
+
+    def __init__(self, key, begin, end):
+        self.key = key
+        self.begin = begin
+        self.end = end
+        self.created = _now()
+        self.future = Future()
+        self.completed = None
+        self.thredds_url = None
+
+    def covers(self, key, begin, end, now, max_lag):
+        """
+        Whether the job's data covers a requested window. A request without
+        an end is covered by data up to max_lag seconds old.
+        """
+        if key != self.key:
+            return False
+        if not np.isnat(self.begin) and (np.isnat(begin) or
+                                         begin < self.begin):
+            return False
+        # A job without an end has the data up to when it was created, and
+        # an unfinished one still picks up everything until now
+        job_end = self.end
+        if np.isnat(job_end):
+            job_end = now if not self.future.done() else self.created
+        if np.isnat(end):
+            end = now - np.timedelta64(int(max_lag * 1e9), "ns")
+        return job_end >= end
+
+
+class JobRegistry():
+    """
+    Registry of the asynchronous M2M data requests made by an OOINet
+    instance. A request is answered with an outstanding or completed job for
+    the same stream and parameters whose window covers the requested one,
+    so concurrent requests are merged into a single job and a window which
+    was already requested doesn't wait in the M2M queue again. The catalog
+    of a covering job may hold data outside the requested window, so the
+    data should be loaded with the requested beginDT and endDT.
+
+        Args:
+            ttl (float): the number of seconds after a job completes for
+                which it is reused. Set to 0 to only merge concurrent requests.
+            max_lag (float): the number of seconds of the newest data which a
+                request without an endDT may miss, i.e. how long a completed
+                open-ended job is reused for such requests
+    """
+
+    def __init__(self, ttl=24*3600, max_lag=10*60):
+        self.ttl = ttl
+        self.max_lag = max_lag
+        self.lock = threading.Lock()
+        self.jobs = []
+
+    def _expire(self):
+        """Forget the completed jobs older than the ttl."""
+        now = time.monotonic()
+        self.jobs = [job for job in self.jobs if not job.future.done()
+                     or now - job.completed < self.ttl]
+
+    def claim(self, key, begin=None, end=None):
+        """
+        Find or create the job for a request.
+
+            Args:
+                key (tuple): the stream and the parameters of the request,
+                    other than its window
+                begin (datetime64): Optional. The start of the window.
+                end (datetime64): Optional. The end of the window. Defaults
+                    to the time the job is created.
+
+            Returns:
+                future (concurrent.futures.Future): resolves to the THREDDS
+                    url of the job
+                owner (bool): True if the job is new, and the caller must
+                    submit it and then call complete() or fail()
+        """
+        begin = np.datetime64("NaT") if begin is None else begin
+        end = np.datetime64("NaT") if end is None else end
+        now = _now()
+        with self.lock:
+            self._expire()
+            for job in self.jobs:
+                if job.covers(key, begin, end, now, self.max_lag):
+                    return job.future, False
+            job = _Job(key, begin, end)
+            self.jobs.append(job)
+        return job.future, True
+
+    def _find(self, future):
+        for job in self.jobs:
+            if job.future is future:
+                return job
+        return None
+
+    def complete(self, future, thredds_url):
+        """
+        Record the THREDDS url of a claimed job, or forget the job if the
+        request returned no url.
+        """
+        with self.lock:
+            job = self._find(future)
+            if job is not None:
+                if thredds_url is None:
+                    self.jobs.remove(job)
+                else:
+                    job.thredds_url = thredds_url
+                    job.completed = time.monotonic()
+        future.set_result(thredds_url)
+
+    def fail(self, future, exc):
+        """Forget a claimed job whose request failed."""
+        with self.lock:
+            job = self._find(future)
+            if job is not None:
+                self.jobs.remove(job)
+        future.set_exception(exc)
+
+    def discard(self, thredds_url):
+        """Forget the job of a THREDDS url, e.g. if it never finished."""
+        with self.lock:
+            self.jobs = [job for job in self.jobs
+                         if job.thredds_url != thredds_url]
+
+    def clear(self):
+        """Forget every completed job."""
+        with self.lock:
+            self.jobs = [job for job in self.jobs if not job.future.done()]
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import threading
+import functools
+
+
+class _NullSpan():
+    """A span which records nothing, returned while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span():
+    """Times a block and records it with the metrics when it exits."""
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start,
+                             error=exc_type is not None, **self.labels)
+        return False
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _format_labels(labels):
+    """Format labels for the Prometheus text format."""
+    if len(labels) == 0:
+        return ""
+    items = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+        value = value.replace('"', '\\"')
+        items.append(f'{key}="{value}"')
+    return "{" + ",".join(items) + "}"
+
+
+class Metrics():
+    """
+    Timing spans and counters for the stages of the pipeline, exported as a
+    structured JSON log with a line per span and a Prometheus textfile (e.g.
+    for the node_exporter textfile collector). Metrics are disabled until
+    enabled, and while disabled span() and count() return immediately
+    without reading the clock or taking a lock.
+
+        Args:
+            prefix (str): the prefix of the Prometheus metric names
+    """
+
+    def __init__(self, prefix="isaias"):
+        self.prefix = prefix
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.log = None
+        self.textfile = None
+        self.reset()
+
+    def enable(self, log_path=None, textfile=None):
+        """
+        Start recording metrics.
+
+            Args:
+                log_path (str): Optional. A file to append a JSON line to for
+                    each span.
+                textfile (str): Optional. The Prometheus textfile written by
+                    flush().
+        """
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+            if log_path is not None:
+                directory = os.path.dirname(log_path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                self.log = open(log_path, "a")
+            self.textfile = textfile
+            self.enabled = True
+
+    def disable(self):
+        """Stop recording metrics and close the log."""
+        with self.lock:
+            self.enabled = False
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+    def reset(self):
+        """Clear the recorded spans, counters, and gauges."""
+        with self.lock:
+            self.spans = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def span(self, name, **labels):
+        """
+        Time a block of code:
+
+            with metrics.span("load_netCDF_files", stream=stream):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, labels)
+
+    def observe(self, name, seconds, error=False, **labels):
+        """Record the duration of a span."""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self.lock:
+            stats = self.spans.get(key)
+            if stats is None:
+                stats = self.spans[key] = {"count": 0, "sum": 0.0,
+                                           "max": 0.0, "errors": 0}
+            stats["count"] += 1
+            stats["sum"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["errors"] += int(error)
+            if self.log is not None:
+                record = {"time": time.time(), "span": name,
+                          "seconds": round(seconds, 6), "error": error}
+                record.update(labels)
+                self.log.write(json.dumps(record) + "\n")
+
+    def count(self, name, value=1, **labels):
+        """Add to a counter, e.g. metrics.count("http_requests", status=200)."""
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        """Set a gauge to a value."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def snapshot(self):
+        """Return a copy of the recorded metrics as a dictionary."""
+        with self.lock:
+            return {
+                "spans": [dict(name=name, labels=dict(labels), **stats)
+                          for (name, labels), stats in self.spans.items()],
+                "counters": [{"name": name, "labels": dict(labels),
+                              "value": value} for (name, labels), value
+                             in self.counters.items()],
+                "gauges": [{"name": name, "labels": dict(labels),
+                            "value": value} for (name, labels), value
+                           in self.gauges.items()]
+            }
+
+    def to_prometheus(self):
+        """Format the recorded metrics in the Prometheus text format."""
+        prefix = self.prefix
+        lines = []
+        with self.lock:
+            spans = sorted(self.spans.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+
+        if len(spans) > 0:
+            lines.append(f"# HELP {prefix}_span_seconds Wall time of each "
+                         "stage of the pipeline.")
+            lines.append(f"# TYPE {prefix}_span_seconds summary")
+            for (name, labels), stats in spans:
+                labels = _format_labels((("span", name),) + labels)
+                lines.append(f"{prefix}_span_seconds_sum{labels} "
+                             f"{stats['sum']:.6f}")
+                lines.append(f"{prefix}_span_seconds_count{labels} "
+                             f"{stats['count']}")
+            lines.append(f"# TYPE {prefix}_span_seconds_max gauge")
+            for (name, labels), stats in spans:
+                labels = _format_labels((("span", name),) + labels)
+                lines.append(f"{prefix}_span_seconds_max{labels} "
+                             f"{stats['max']:.6f}")
+            lines.append(f"# TYPE {prefix}_span_errors_total counter")
+            for (name, labels), stats in spans:
+                labels = _format_labels((("span", name),) + labels)
+                lines.append(f"{prefix}_span_errors_total{labels} "
+                             f"{stats['errors']}")
+
+        # Group the samples of each counter and gauge under one TYPE line
+        for kind, samples, suffix in [("counter", counters, "_total"),
+                                      ("gauge", gauges, "")]:
+            current = None
+            for (name, labels), value in samples:
+                metric = f"{prefix}_{name}{suffix}"
+                if metric != current:
+                    lines.append(f"# TYPE {metric} {kind}")
+                    current = metric
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=None):
+        """Atomically write the Prometheus textfile."""
+        path = path or self.textfile
+        if path is None:
+            return
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Flush the JSON log and write the Prometheus textfile."""
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.log is not None:
+                self.log.flush()
+        self.write_textfile()
+
+
+# The process-wide metrics
+_metrics = Metrics()
+
+
+def get_metrics():
+    """Return the process-wide metrics."""
+    return _metrics
+
+
+def timed(name):
+    """
+    Decorate a function to time each call as a span of the process-wide
+    metrics. While the metrics are disabled the function is called directly.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _metrics.enabled:
+                return func(*args, **kwargs)
+            with _Span(_metrics, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
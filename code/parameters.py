@@ -0,0 +1,95 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ParameterRegistry():
+    """
+    Memo of the data level of each OOINet parameter id (pdId). Data levels
+    never change, so once resolved a pdId is kept for the life of the process
+    and, if a path is given, persisted to a json file between runs. A pdId
+    whose data level couldn't be fetched (e.g. preload answered with an
+    error) is left unresolved, so it's fetched again on the next call.
+
+        Args:
+            path (str): Optional. The json file in which to persist the
+                resolved data levels.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.levels = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                levels = json.load(f)
+            # Drop the failed lookups persisted by older versions
+            self.levels = {pid: level for pid, level in levels.items()
+                           if level is not None}
+
+    def __contains__(self, pdId):
+        return pdId in self.levels
+
+    def get(self, pdId):
+        """Return the data level of a pdId, or None if unknown."""
+        return self.levels.get(pdId)
+
+    def save(self):
+        """Atomically write the resolved data levels to disk."""
+        if self.path is None:
+            return
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.levels, f)
+            os.replace(tmp_path, self.path)
+
+    def resolve(self, pdIds, fetch, max_workers=8, batch_size=50):
+        """
+        Resolve the data levels for a set of pdIds, fetching only the ones
+        which aren't already known. Unknown pdIds are fetched concurrently in
+        batches, and the registry is saved after each batch.
+
+            Args:
+                pdIds (list): the parameter ids to resolve
+                fetch (callable): a function which takes a pdId and returns
+                    its data level, or None if it couldn't be fetched
+                max_workers (int): maximum number of concurrent requests
+                batch_size (int): the number of pdIds fetched between saves
+
+            Returns:
+                levels (dict): a dictionary of each pdId to its data level,
+                    or None for the pdIds which couldn't be resolved
+        """
+        pdIds = list(dict.fromkeys(pdIds))
+        unknown = [pid for pid in pdIds if pid not in self.levels]
+
+        if len(unknown) > 0:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for i in range(0, len(unknown), batch_size):
+                    batch = unknown[i:i+batch_size]
+                    results = executor.map(fetch, batch)
+                    with self.lock:
+                        self.levels.update(
+                            (pid, level) for pid, level in zip(batch, results)
+                            if level is not None)
+                    self.save()
+
+        return {pid: self.levels.get(pid) for pid in pdIds}
+
+
+# Registries shared by every OOINet instance in the process, by path
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(path=None):
+    """Return the process-wide parameter registry for a path."""
+    with _registries_lock:
+        if path not in _registries:
+            _registries[path] = ParameterRegistry(path)
+        return _registries[path]
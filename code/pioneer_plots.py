@@ -1,79 +1,87 @@
 import yaml
 import os
-import numpy as np
+import argparse
 import datetime
-import matplotlib.pyplot as plt
+import time
 from utils import OOINet
+from render import Renderer
+from sync import IncrementalSync
+from scheduler import Scheduler
+from metrics import get_metrics
+from pipeline import Pipeline, load_spec
 import warnings
 warnings.filterwarnings("ignore")
 
-
-def plot_ts(x1, y1, c1, x2, y2, c2, title=None):
-    """Plot two label figures."""
-    fig, ax1 = plt.subplots(figsize=(10, 5))
-    ax1.plot(x1, y1, c=c1)
-
-    # ===============================
-    # Plot the second axis
-    ax2 = ax1.twinx()
-
-    ax2.plot(x2, y2, c=c2)
-
-    # ===============================
-    # Add in labels
-    # X-axis
-    if "long_name" in x1.attrs:
-        ax1.set_xlabel(x1.attrs["long_name"], fontsize=12)
-    elif "standard_name" in x1.attrs:
-        ax1.set_xlabel(x1.attrs["standard_name"], fontsize=12)
-    else:
-        pass
-    # Format first y-axis
-    if "long_name" in y1.attrs:
-        ax1.set_ylabel(y1.attrs["long_name"], fontsize=12)
-    elif "standard_name" in y1.attrs:
-        ax1.set_ylabel(y1.attrs["standard_name"], fontsize=12)
-    else:
-        pass
-    # Format second y-axis
-    if "long_name" in y2.attrs:
-        ax2.set_ylabel(y2.attrs["long_name"], fontsize=12)
-    elif "standard_name" in y2.attrs:
-        ax2.set_ylabel(y2.attrs["standard_name"], fontsize=12)
-    else:
-        pass
-
-    # Add in a grid
-    # ax1.grid()
-
-    # Add in units
-    if "units" in y1.attrs:
-        ylabel = ax1.get_ylabel()
-        ylabel = ylabel + "\n" + y1.attrs["units"]
-        ax1.set_ylabel(ylabel, fontsize=12, color=c1)
-    if "units" in y2.attrs:
-        ylabel = ax2.get_ylabel()
-        ylabel = ylabel + "\n" + y2.attrs["units"]
-        ax2.set_ylabel(ylabel, fontsize=12, color=c2)
-    if "units" in x1.attrs:
-        xlabel = ax1.get_xlabel()
-        xlabel = xlabel + "\n" + x1.attrs["units"]
-        ax1.set_xlabel(xlabel, fontsize=12)
-
-    # Add in title
-    if title is not None:
-        ax1.set_title(title)
-
-    # Check if the x-axis is time. If it is, autoformat
-    if x1.attrs["standard_name"] == "time":
-        fig.autofmt_xdate()
-
-    # Return the figure
-    return fig
+# The streams, derived variables, and figures to plot
+SPEC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "pioneer.yaml")
+
+
+def run(sync, renderer, basePath, spec=None, max_workers=8, per_host=4):
+    """
+    Run one cycle of the pipeline: sync the new data for each stream, derive
+    the variables, and render each figure as soon as its data is ready.
+
+        Args:
+            sync (IncrementalSync): syncs the retained window of each stream
+            renderer (Renderer): renders the figures
+            basePath (str): the directory to save the plots directory to
+            spec (dict): Optional. The pipeline specification. Defaults to
+                pioneer.yaml.
+            max_workers (int): the maximum number of tasks to run at once
+            per_host (int): the maximum requests in flight to each host
+
+        Returns:
+            errors (dict): the exception of each task which failed
+    """
+    if spec is None:
+        spec = load_spec(SPEC_PATH)
+    pipeline = Pipeline(sync, renderer, spec, basePath,
+                        max_workers=max_workers, per_host=per_host)
+    results, errors = pipeline.run()
+    return errors
+
+
+def run_and_report(sync, renderer, basePath, **kwargs):
+    """
+    Run one cycle of the pipeline, then record its outcome and export the
+    metrics (if enabled).
+    """
+    metrics = get_metrics()
+    success = False
+    try:
+        with metrics.span("pipeline.run"):
+            errors = run(sync, renderer, basePath, **kwargs)
+        success = len(errors) == 0
+    finally:
+        metrics.gauge("last_run_timestamp_seconds", time.time())
+        metrics.gauge("last_run_success", int(success))
+        metrics.flush()
 
 
 if __name__ == '__main__':
 
+    parser = argparse.ArgumentParser(
+        description="Plot the Pioneer Array surface conditions.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and re-run on a schedule")
+    parser.add_argument("--interval", type=float, default=2*3600,
+                        help="seconds between runs in daemon mode")
+    parser.add_argument("--offset", type=float, default=10*60,
+                        help="seconds after each interval boundary to run")
+    parser.add_argument("--metrics-log",
+                        help="append a JSON line per timing span to a file")
+    parser.add_argument("--metrics-textfile",
+                        help="write Prometheus metrics to a textfile")
+    parser.add_argument("--spec", default=SPEC_PATH,
+                        help="the yaml pipeline specification to run")
+    parser.add_argument("--max-workers", type=int, default=8,
+                        help="maximum number of pipeline tasks run at once")
+    parser.add_argument("--per-host", type=int, default=4,
+                        help="maximum requests in flight to each host")
+    args = parser.parse_args()
+    spec = load_spec(args.spec)
+
     # Set the basepath (this is because cron fucking sucks)
     basePath = "/home/andrew/Documents/OOI-CGSN/QAQC_Sandbox/Hurricane_Isaias/Isaias"
 
@@ -82,139 +90,34 @@ if __name__ == '__main__':
     username = userinfo['apiname']
     token = userinfo['apikey']
 
-    # Initialize the OOINet Tool with username and token
-    OOI = OOINet(username, token)
-
-    # List the datasets that I need
-    beginDT = datetime.datetime.now() - datetime.timedelta(hours=48)
-
-    ISSM_METBK = {
-        "refdes": "CP03ISSM-SBD11-06-METBKA000",
-        "method": "telemetered",
-        "stream": "metbk_a_dcl_instrument"
-    }
-    OSSM_METBK = {
-        "refdes": "CP04OSSM-SBD11-06-METBKA000",
-        "method": "telemetered",
-        "stream": "metbk_a_dcl_instrument"
-    }
-    CNSM_METBK = {
-        "refdes": "CP01CNSM-SBD11-06-METBKA000",
-        "method": "telemetered",
-        "stream": "metbk_a_dcl_instrument"
-    }
-    CNSM_WAVSS = {
-        "refdes": "CP01CNSM-SBD12-05-WAVSSA000",
-        "method": "telemetered",
-        "stream": "wavss_a_dcl_statistics"
-    }
-
-    # ==========================================================
-    # Download the CP01CNSM METBK dataset
-    refdes = CNSM_METBK["refdes"]
-    method = CNSM_METBK["method"]
-    stream = CNSM_METBK["stream"]
-
-    # Request the desired datasets
-    thredds_url = OOI.get_thredds_url(refdes=refdes, method=method,
-                                      stream=stream, beginDT=beginDT)
-    # Get the datasets
-    catalog = OOI.get_thredds_catalog(thredds_url)
-    catalog = OOI.parse_catalog(catalog, exclude=["ENG", "gps", "velpt"])
-    # Load the dataset
-    cnsm_metbk = OOI.load_netCDF_files(catalog)
-
-    # Calculate the wind speed from the component vectors
-    cnsm_metbk = cnsm_metbk.assign(wind_speed=lambda x: np.sqrt(
-                                   np.square(x.northward_wind_velocity) +
-                                   np.square(x.eastward_wind_velocity)))
-    cnsm_metbk.wind_speed.attrs["long_name"] = "Wind Speed"
-    cnsm_metbk.wind_speed.attrs["units"] = "m s-1"
-
-    # ===========================================================
-    # Download the CP01CNSM WAVSS dataset
-    refdes = CNSM_WAVSS["refdes"]
-    method = CNSM_WAVSS["method"]
-    stream = CNSM_WAVSS["stream"]
-
-    # Request the desired datasets
-    thredds_url = OOI.get_thredds_url(refdes=refdes, method=method,
-                                      stream=stream, beginDT=beginDT)
-    # Get the datasets
-    catalog = OOI.get_thredds_catalog(thredds_url)
-    catalog = OOI.parse_catalog(catalog, exclude=["ENG", "gps", "velpt"])
-    # Load the dataset
-    cnsm_wavss = OOI.load_netCDF_files(catalog)
-
-    # ==========================================================
-    # Download the CP03ISSM METBK dataset
-    refdes = ISSM_METBK["refdes"]
-    method = ISSM_METBK["method"]
-    stream = ISSM_METBK["stream"]
-
-    # Request the desired datasets
-    thredds_url = OOI.get_thredds_url(refdes=refdes, method=method,
-                                      stream=stream, beginDT=beginDT)
-    # Get the datasets
-    catalog = OOI.get_thredds_catalog(thredds_url)
-    catalog = OOI.parse_catalog(catalog, exclude=["ENG", "gps", "velpt"])
-    # Load the dataset
-    issm_metbk = OOI.load_netCDF_files(catalog)
-
-    # Calculate the wind speed
-    issm_metbk = issm_metbk.assign(wind_speed=lambda x: np.sqrt(
-                                   np.square(x.northward_wind_velocity) +
-                                   np.square(x.eastward_wind_velocity)))
-    issm_metbk.wind_speed.attrs["long_name"] = "Wind Speed"
-    issm_metbk.wind_speed.attrs["units"] = "m s-1"
-
-    # =========================================================
-    # Download the CP04OSSM METBK dataset
-    refdes = OSSM_METBK["refdes"]
-    method = OSSM_METBK["method"]
-    stream = OSSM_METBK["stream"]
-
-    # Request the desired datasets
-    thredds_url = OOI.get_thredds_url(refdes=refdes, method=method,
-                                      stream=stream, beginDT=beginDT)
-    # Get the datasets
-    catalog = OOI.get_thredds_catalog(thredds_url)
-    catalog = OOI.parse_catalog(catalog, exclude=["ENG", "gps", "velpt"])
-    # Load the dataset
-    ossm_metbk = OOI.load_netCDF_files(catalog)
-
-    # Calculate the wind speed
-    ossm_metbk = ossm_metbk.assign(wind_speed=lambda x: np.sqrt(
-                                   np.square(x.northward_wind_velocity) +
-                                   np.square(x.eastward_wind_velocity)))
-    ossm_metbk.wind_speed.attrs["long_name"] = "Wind Speed"
-    ossm_metbk.wind_speed.attrs["units"] = "m s-1"
-
-    # =========================================================
-    # Plot and save the figures. Will save to a local "plots" directory
-    if not os.path.exists(f"{basePath}/plots"):
-        os.makedirs("plots")
-
-    # Plot the CNSM sea surface temps and salinity
-    cnsm_sst_sss = plot_ts(cnsm_metbk.time, cnsm_metbk.sea_surface_temperature,
-                           "tab:red", cnsm_metbk.time, cnsm_metbk.met_salsurf,
-                           "tab:blue", cnsm_metbk.attrs["Location_name"])
-    cnsm_sst_sss.savefig(f"{basePath}/plots/cnsm_sst_sss.png", dpi=300)
-
-    # Plot the CNSM wave height and wind Speed
-    cnsm_wh_ws = plot_ts(cnsm_metbk.time, cnsm_metbk.wind_speed, "tab:blue",
-                         cnsm_wavss.time, cnsm_wavss.significant_wave_height,
-                         "tab:red", cnsm_metbk.attrs["Location_name"])
-    cnsm_wh_ws.savefig(f"{basePath}/plots/cnsm_wh_ws.png", dpi=300)
-
-    # Plot the ISSM sea surface temps and salinity
-    issm_sst_sss = plot_ts(issm_metbk.time, issm_metbk.sea_surface_temperature,
-                           "tab:red", issm_metbk.time, issm_metbk.met_salsurf,
-                           "tab:blue", issm_metbk.attrs["Location_name"])
-    issm_sst_sss.savefig(f"{basePath}/plots/issm_sst_sss.png", dpi=300)
-
-    # Plot the OSSM sea surface temps and salinity
-    ossm_sst_sss = plot_ts(ossm_metbk.time, ossm_metbk.sea_surface_temperature,
-                           "tab:red", ossm_metbk.time, ossm_metbk.met_salsurf,
-                           "tab:blue", ossm_metbk.attrs["Location_name"])
-    ossm_sst_sss.savefig(f"{basePath}/plots/ossm_sst_sss.png", dpi=300)
+    # Record the timing of each stage and the request counters, if asked
+    if args.metrics_log or args.metrics_textfile:
+        get_metrics().enable(log_path=args.metrics_log,
+                             textfile=args.metrics_textfile)
+
+    # Initialize the OOINet Tool with username and token. Slow-changing
+    # metadata (vocab, deployments, preload) is cached between runs
+    OOI = OOINet(username, token, cache_dir=f"{basePath}/cache")
+
+    # Only request the data that is new since the last run, retaining a
+    # local window (48 hours by default) of each dataset
+    sync = IncrementalSync(OOI, f"{basePath}/data",
+                           window=datetime.timedelta(
+                               hours=spec["window_hours"]))
+
+    renderer = Renderer()
+    options = dict(spec=spec, max_workers=args.max_workers,
+                   per_host=args.per_host)
+    try:
+        if args.daemon:
+            # Keep the session, caches, and render workers warm between
+            # runs. Send SIGUSR1 to run now, SIGTERM or SIGINT to stop.
+            scheduler = Scheduler(
+                lambda: run_and_report(sync, renderer, basePath, **options),
+                interval=args.interval, offset=args.offset)
+            scheduler.install_signal_handlers()
+            scheduler.run()
+        else:
+            run_and_report(sync, renderer, basePath, **options)
+    finally:
+        renderer.close()
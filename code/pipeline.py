@@ -0,0 +1,376 @@
+"""
+Declarative plotting pipelines. A pipeline is specified in yaml as:
+
+    window_hours: 48            # hours of data to retain and plot
+    exclude: [ENG, gps]         # keywords of THREDDS files not to load
+    streams:
+      <name>:
+        refdes: CP01CNSM-SBD11-06-METBKA000
+        method: telemetered
+        stream: metbk_a_dcl_instrument
+        variables: [...]        # Optional. Defaults to every variable.
+        derived: [wind_speed]   # Optional. Variables to derive (derived.py)
+    figures:
+      <name>:                   # saved to plots/<name>.png
+        - {stream: <name>, variable: <variable>, color: tab:red}
+        - {stream: <name>, variable: <variable>, color: tab:blue}
+
+and run as a dependency graph: the data request of every stream is sent at
+once, each stream is loaded as soon as its THREDDS job is finished, and
+each figure is rendered as soon as the streams it plots are loaded. Requests
+are limited per host, so many moorings can be run together without
+overwhelming OOINet or the THREDDS server.
+"""
+import os
+import datetime
+import threading
+import yaml
+from collections import defaultdict
+from concurrent.futures import (Future, ThreadPoolExecutor, CancelledError,
+                                wait, FIRST_COMPLETED)
+from urllib.parse import urlsplit
+from metrics import get_metrics
+from render import PlotManifest, plot_spec
+from derived import REGISTRY as DERIVED
+from polling import ThreddsTimeoutError
+
+
+class DependencyError(Exception):
+    """Raised for a task which wasn't run because a dependency failed."""
+    pass
+
+
+def run_graph(tasks, max_workers=8):
+    """
+    Run a graph of tasks on a bounded pool of threads, starting each task as
+    soon as all of its dependencies have finished. A task may return a
+    concurrent.futures.Future (e.g. of a THREDDS job or a render process), in
+    which case the task finishes when the future resolves, without holding
+    a thread while it waits.
+
+        Args:
+            tasks (dict): a dictionary of task names to (func, deps) tuples,
+                where func is called with the results of the deps (a list of
+                task names) as its arguments
+            max_workers (int): the maximum number of tasks to run at once
+
+        Returns:
+            results (dict): the result of each task which succeeded
+            errors (dict): the exception of each task which failed, or a
+                DependencyError for tasks which weren't run
+    """
+    # Check the graph is complete and acyclic
+    for name, (func, deps) in tasks.items():
+        for dep in deps:
+            if dep not in tasks:
+                raise ValueError(f'Task {name} depends on unknown task {dep}')
+    order = []
+    visited = set()
+    visiting = set()
+
+    def visit(name):
+        if name in visited:
+            return
+        if name in visiting:
+            raise ValueError(f'Task {name} is part of a dependency cycle')
+        visiting.add(name)
+        for dep in tasks[name][1]:
+            visit(dep)
+        visiting.discard(name)
+        visited.add(name)
+        order.append(name)
+
+    for name in tasks:
+        visit(name)
+
+    waiting = {name: set(deps) for name, (func, deps) in tasks.items()}
+    dependents = defaultdict(list)
+    for name, (func, deps) in tasks.items():
+        for dep in deps:
+            dependents[dep].append(name)
+
+    results = {}
+    errors = {}
+    running = {}
+
+    def skip(name, failed):
+        for dependent in dependents[name]:
+            if dependent in waiting:
+                del waiting[dependent]
+                errors[dependent] = DependencyError(
+                    f'{dependent} not run since {failed} failed')
+                skip(dependent, failed)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def start(name):
+            func, deps = tasks[name]
+            args = [results[dep] for dep in deps]
+            running[executor.submit(func, *args)] = name
+
+        for name in [name for name in order if len(waiting[name]) == 0]:
+            del waiting[name]
+            start(name)
+
+        while len(running) > 0:
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    errors[name] = exc
+                    skip(name, name)
+                    continue
+
+                # Wait on a returned future without holding a thread
+                if isinstance(result, Future):
+                    running[result] = name
+                    continue
+
+                results[name] = result
+                for dependent in dependents[name]:
+                    if dependent not in waiting:
+                        continue
+                    waiting[dependent].discard(name)
+                    if len(waiting[dependent]) == 0:
+                        del waiting[dependent]
+                        start(dependent)
+
+    return results, errors
+
+
+class HostLimiter():
+    """
+    Limits the number of requests in flight to each host.
+
+        Args:
+            limit (int): the maximum concurrent requests per host
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    def hold(self, url):
+        """Return a semaphore to hold while requesting a url."""
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self.semaphores[host]
+
+
+def load_spec(path):
+    """
+    Load and check a pipeline specification from a yaml file.
+
+        Returns:
+            spec (dict): the specification, with the defaults filled in
+
+        Raises:
+            ValueError: if the specification is invalid
+    """
+    with open(path) as f:
+        spec = yaml.safe_load(f)
+    if not isinstance(spec, dict):
+        raise ValueError(f'Pipeline spec {path} must be a mapping')
+
+    spec.setdefault("window_hours", 48)
+    spec.setdefault("exclude", [])
+    streams = spec.setdefault("streams", {})
+    figures = spec.setdefault("figures", {})
+
+    for name, stream in streams.items():
+        for key in ["refdes", "method", "stream"]:
+            if key not in stream:
+                raise ValueError(f'Stream {name} is missing {key}')
+        stream.setdefault("derived", [])
+        for variable in stream["derived"]:
+            if variable not in DERIVED:
+                raise ValueError(
+                    f'Stream {name} derives unknown variable {variable}')
+
+    for name, axes in figures.items():
+        if not isinstance(axes, list) or len(axes) != 2:
+            raise ValueError(f'Figure {name} must have two axes')
+        for axis in axes:
+            for key in ["stream", "variable", "color"]:
+                if key not in axis:
+                    raise ValueError(f'An axis of figure {name} is missing '
+                                     f'{key}')
+            if axis["stream"] not in streams:
+                raise ValueError(f'Figure {name} plots unknown stream '
+                                 f'{axis["stream"]}')
+
+    return spec
+
+
+class Pipeline():
+    """
+    Runs a pipeline specification as a dependency graph of tasks:
+
+        request:<stream>  submit the data request (limited per M2M host)
+        wait:<stream>     wait for the THREDDS job, without holding a thread
+        load:<stream>     load, merge, and derive the new data (limited per
+                          THREDDS host)
+        figure:<figure>   build and render a figure once its streams load
+
+        Args:
+            sync (IncrementalSync): syncs the retained window of each stream
+            renderer (Renderer): renders the figures
+            spec (dict): the pipeline specification from load_spec
+            basePath (str): the directory to save the plots directory to
+            max_workers (int): the maximum number of tasks to run at once
+            per_host (int): the maximum requests in flight to each host
+            timeout (float): seconds to wait for each THREDDS job
+    """
+
+    def __init__(self, sync, renderer, spec, basePath, max_workers=8,
+                 per_host=4, timeout=10*60):
+
+        self.sync = sync
+        self.renderer = renderer
+        self.spec = spec
+        self.basePath = basePath
+        self.max_workers = max_workers
+        self.limiter = HostLimiter(per_host)
+        self.timeout = timeout
+        self.manifest_lock = threading.Lock()
+        self.now = None
+
+    def request(self, name):
+        """Submit the data request of a stream."""
+        stream = self.spec["streams"][name]
+        ooinet = self.sync.ooinet
+        with get_metrics().span("pipeline.request", stream=name):
+            with self.limiter.hold(ooinet.urls["data"]):
+                return self.sync.request(stream["refdes"], stream["method"],
+                                         stream["stream"], now=self.now)
+
+    def wait(self, request):
+        """
+        Return a future which resolves once the THREDDS job of a request is
+        finished, to the exception with which polling the job failed (or
+        None), and which is cancelled if polling the job is cancelled.
+        """
+        ready = Future()
+        if request["thredds_url"] is None:
+            ready.set_result(None)
+            return ready
+
+        job = self.sync.ooinet.poll_thredds_job(request["thredds_url"],
+                                                timeout=self.timeout)
+
+        def finished(job):
+            if job.cancelled():
+                ready.set_exception(CancelledError(
+                    f'Polling {request["thredds_url"]} was cancelled'))
+            else:
+                ready.set_result(job.exception())
+
+        job.add_done_callback(finished)
+        return ready
+
+    def load(self, name, request, error):
+        """
+        Load and merge the new data of a stream and derive variables. If the
+        THREDDS job timed out, the retained window is used; any other error
+        of the job is raised.
+        """
+        stream = self.spec["streams"][name]
+        if isinstance(error, ThreddsTimeoutError):
+            # Fall back on the retained window
+            print(f'Data request for {name} timed out')
+            get_metrics().count("thredds_timeouts", stream=name)
+            request = dict(request, thredds_url=None)
+        elif error is not None:
+            raise error
+
+        # Load the inputs of the derived variables too
+        variables = stream.get("variables")
+        if variables is not None:
+            variables = variables + DERIVED.inputs(stream["derived"])
+
+        with get_metrics().span("pipeline.load", stream=name):
+            with self.limiter.hold(self.sync.ooinet.thredds_server):
+                ds = self.sync.complete(request, exclude=self.spec["exclude"],
+                                        variables=variables)
+            if ds is None:
+                raise ValueError(f'No data for stream {name}')
+            ds = DERIVED.derive(ds, stream["derived"])
+
+        print(f'Loaded {name}')
+        return ds
+
+    def figure(self, name, manifest, *datasets):
+        """Build a figure and submit it to render, unless it's current."""
+        (axis1, axis2) = self.spec["figures"][name]
+        ds1, ds2 = datasets
+        path = os.path.join(self.basePath, "plots", f"{name}.png")
+        with get_metrics().span("pipeline.plot_spec", figure=name):
+            spec = plot_spec(ds1.time, ds1[axis1["variable"]], axis1["color"],
+                             ds2.time, ds2[axis2["variable"]], axis2["color"],
+                             path, title=ds1.attrs.get("Location_name"))
+
+        with self.manifest_lock:
+            if manifest.is_current(spec):
+                get_metrics().count("figures", status="skipped")
+                return path
+        get_metrics().count("figures", status="rendered")
+
+        def rendered(future):
+            if not future.cancelled() and future.exception() is None:
+                with self.manifest_lock:
+                    manifest.update(spec)
+                    manifest.save()
+
+        future = self.renderer.submit(spec)
+        future.add_done_callback(rendered)
+        return future
+
+    def tasks(self, manifest):
+        """Build the dependency graph of the pipeline's tasks."""
+        tasks = {}
+        for name in self.spec["streams"]:
+            tasks[f"request:{name}"] = (
+                lambda name=name: self.request(name), [])
+            tasks[f"wait:{name}"] = (self.wait, [f"request:{name}"])
+            tasks[f"load:{name}"] = (
+                lambda request, error, name=name: self.load(name, request,
+                                                            error),
+                [f"request:{name}", f"wait:{name}"])
+        for name, axes in self.spec["figures"].items():
+            tasks[f"figure:{name}"] = (
+                lambda *datasets, name=name: self.figure(name, manifest,
+                                                         *datasets),
+                [f"load:{axis['stream']}" for axis in axes])
+        return tasks
+
+    def run(self, now=None):
+        """
+        Run the pipeline once.
+
+            Args:
+                now (datetime): Optional. The end of the window, defaults to
+                    the current (UTC) time.
+
+            Returns:
+                results (dict): the loaded dataset of each stream and the
+                    path of each figure, by task name
+                errors (dict): the exception of each task which failed
+        """
+        if now is None:
+            now = datetime.datetime.utcnow()
+        self.now = now
+        plots = os.path.join(self.basePath, "plots")
+        if not os.path.exists(plots):
+            os.makedirs(plots)
+        manifest = PlotManifest(os.path.join(plots, "manifest.json"))
+
+        results, errors = run_graph(self.tasks(manifest),
+                                    max_workers=self.max_workers)
+        for name, exc in errors.items():
+            print(f'{name} failed: {exc}')
+        return results, errors
@@ -0,0 +1,173 @@
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+
+class ThreddsTimeoutError(Exception):
+    """Raised when a THREDDS data request doesn't finish before a timeout."""
+    pass
+
+
+class ThreddsPoller():
+    """
+    A single background poller which watches the status of many outstanding
+    THREDDS data requests. Each job's status url is checked with exponential
+    backoff and jitter, and callers get a concurrent.futures.Future which
+    resolves when the job is ready (wrap it with asyncio.wrap_future to await
+    it from asyncio code). The checks run on a small pool of threads, so a
+    slow status url doesn't hold up the checks of the other jobs.
+
+        Args:
+            check (callable): a function taking a status url and returning
+                True once the job is ready. It should return False rather
+                than raise for transient errors, since an exception fails
+                the job.
+            initial_delay (float): seconds between the first and second
+                status checks
+            max_delay (float): the maximum seconds between status checks
+            backoff (float): the factor by which the delay grows each check
+            jitter (float): the fraction of each delay randomly added or
+                removed, to spread out checks of jobs submitted together
+            timeout (float): default seconds after which a job is failed with
+                a ThreddsTimeoutError
+            max_workers (int): the number of status checks to run at once
+    """
+
+    def __init__(self, check, initial_delay=2, max_delay=60, backoff=2,
+                 jitter=0.25, timeout=10*60, max_workers=4):
+
+        self.check = check
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.jitter = jitter
+        self.timeout = timeout
+
+        self.jobs = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _delay(self, attempts):
+        """The delay before the next check with backoff and jitter."""
+        delay = min(self.initial_delay * self.backoff**attempts,
+                    self.max_delay)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def submit(self, status_url, callback=None, timeout=None):
+        """
+        Start watching a job's status url.
+
+            Args:
+                status_url (str): the url which is available once the job is
+                    finished
+                callback (callable): Optional. Called after each check with
+                    the status url, number of checks, elapsed seconds, and
+                    whether the job is ready.
+                timeout (float): Optional. Overrides the default timeout.
+
+            Returns:
+                future (concurrent.futures.Future): resolves to the status url
+                    once the job is ready, or raises ThreddsTimeoutError
+        """
+        if timeout is None:
+            timeout = self.timeout
+        future = Future()
+        now = time.monotonic()
+        job = {
+            "status_url": status_url,
+            "future": future,
+            "callback": callback,
+            "start": now,
+            "deadline": now + timeout,
+            "attempts": 0
+        }
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("ThreddsPoller is closed")
+            # Check the status immediately, in case the job is already done
+            heapq.heappush(self.jobs, (now, next(self.counter), job))
+            self.condition.notify()
+        return future
+
+    def _resolve(self, future, result=None, exception=None):
+        """Set the outcome of a job, unless the caller cancelled it."""
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _run(self):
+        """Check the jobs as they come due, until the poller is closed."""
+        while True:
+            with self.condition:
+                while not self.closed and (len(self.jobs) == 0 or
+                                           self.jobs[0][0] > time.monotonic()):
+                    if len(self.jobs) == 0:
+                        self.condition.wait()
+                    else:
+                        self.condition.wait(self.jobs[0][0] - time.monotonic())
+                if self.closed:
+                    return
+                _, _, job = heapq.heappop(self.jobs)
+
+            # Check the job status on the pool, outside of the lock
+            if job["future"].cancelled():
+                continue
+            self.executor.submit(self._check, job)
+
+    def _check(self, job):
+        """Check the status of a job, and resolve or reschedule it."""
+        future = job["future"]
+        try:
+            ready = self.check(job["status_url"])
+        except Exception as exc:
+            self._resolve(future, exception=exc)
+            return
+        job["attempts"] += 1
+        now = time.monotonic()
+
+        if job["callback"] is not None:
+            try:
+                job["callback"](job["status_url"], job["attempts"],
+                                now - job["start"], ready)
+            except Exception:
+                pass
+
+        if ready:
+            self._resolve(future, result=job["status_url"])
+        elif now >= job["deadline"]:
+            self._resolve(future, exception=ThreddsTimeoutError(
+                f'Request timed out after {now - job["start"]:.0f} s: '
+                f'{job["status_url"]}'))
+        else:
+            next_check = min(now + self._delay(job["attempts"] - 1),
+                             job["deadline"])
+            with self.condition:
+                if self.closed:
+                    future.cancel()
+                    return
+                heapq.heappush(self.jobs,
+                               (next_check, next(self.counter), job))
+                self.condition.notify()
+
+    def close(self):
+        """Stop the poller, cancelling any jobs still being watched."""
+        with self.condition:
+            self.closed = True
+            jobs = self.jobs
+            self.jobs = []
+            self.condition.notify()
+        for _, _, job in jobs:
+            job["future"].cancel()
+        self.thread.join()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+import numpy as np
+import matplotlib
+# Force a non-interactive backend, since figures are only saved to files
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from concurrent.futures import Future, ProcessPoolExecutor
+from downsample import downsample
+from metrics import get_metrics, timed
+
+
+# The size of the rendered figures in inches
+FIGSIZE = (10, 5)
+
+# Figure reused by every render in the current (worker) process
+_figure = None
+
+
+class Series():
+    """
+    A picklable stand-in for an xarray.DataArray holding just the values and
+    attributes needed to plot it, so it can be sent to a worker process.
+    """
+
+    def __init__(self, values, attrs):
+        self.values = values
+        self.attrs = attrs
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.values
+        return self.values.astype(dtype)
+
+    def __len__(self):
+        return len(self.values)
+
+
+def to_series(da):
+    """Convert an xarray.DataArray into a Series."""
+    return Series(da.values, dict(da.attrs))
+
+
+def plot_ts(x1, y1, c1, x2, y2, c2, title=None, fig=None):
+    """
+    Plot two label figures. If a figure is given, it is cleared and reused
+    rather than creating a new one.
+    """
+    if fig is None:
+        fig, ax1 = plt.subplots(figsize=FIGSIZE)
+    else:
+        fig.clf()
+        fig.set_size_inches(FIGSIZE)
+        ax1 = fig.add_subplot(111)
+    ax1.plot(x1, y1, c=c1)
+
+    # ===============================
+    # Plot the second axis
+    ax2 = ax1.twinx()
+
+    ax2.plot(x2, y2, c=c2)
+
+    # ===============================
+    # Add in labels
+    # X-axis
+    if "long_name" in x1.attrs:
+        ax1.set_xlabel(x1.attrs["long_name"], fontsize=12)
+    elif "standard_name" in x1.attrs:
+        ax1.set_xlabel(x1.attrs["standard_name"], fontsize=12)
+    else:
+        pass
+    # Format first y-axis
+    if "long_name" in y1.attrs:
+        ax1.set_ylabel(y1.attrs["long_name"], fontsize=12)
+    elif "standard_name" in y1.attrs:
+        ax1.set_ylabel(y1.attrs["standard_name"], fontsize=12)
+    else:
+        pass
+    # Format second y-axis
+    if "long_name" in y2.attrs:
+        ax2.set_ylabel(y2.attrs["long_name"], fontsize=12)
+    elif "standard_name" in y2.attrs:
+        ax2.set_ylabel(y2.attrs["standard_name"], fontsize=12)
+    else:
+        pass
+
+    # Add in a grid
+    # ax1.grid()
+
+    # Add in units
+    if "units" in y1.attrs:
+        ylabel = ax1.get_ylabel()
+        ylabel = ylabel + "\n" + y1.attrs["units"]
+        ax1.set_ylabel(ylabel, fontsize=12, color=c1)
+    if "units" in y2.attrs:
+        ylabel = ax2.get_ylabel()
+        ylabel = ylabel + "\n" + y2.attrs["units"]
+        ax2.set_ylabel(ylabel, fontsize=12, color=c2)
+    if "units" in x1.attrs:
+        xlabel = ax1.get_xlabel()
+        xlabel = xlabel + "\n" + x1.attrs["units"]
+        ax1.set_xlabel(xlabel, fontsize=12)
+
+    # Add in title
+    if title is not None:
+        ax1.set_title(title)
+
+    # Check if the x-axis is time. If it is, autoformat
+    if x1.attrs["standard_name"] == "time":
+        fig.autofmt_xdate()
+
+    # Return the figure
+    return fig
+
+
+def data_fingerprint(series, params, tail=1024):
+    """
+    Compute a cheap fingerprint of the data and parameters of a figure from
+    the length of each series and a checksum of its last values (which
+    includes the last timestamp), rather than hashing all of the data.
+
+        Args:
+            series (list): the Series plotted in the figure
+            params (dict): the plot parameters, which must be json encodable
+            tail (int): the number of values at the end of each series to
+                include in the checksum
+
+        Returns:
+            fingerprint (str): a hex digest of the data and parameters
+    """
+    digest = hashlib.sha1()
+    for s in series:
+        values = np.asarray(s.values)
+        digest.update(str((len(values), values.dtype.str)).encode())
+        digest.update(np.ascontiguousarray(values[-tail:]).tobytes())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class PlotManifest():
+    """
+    Record of the fingerprint of each rendered figure, persisted to a json
+    file, used to skip rendering figures whose inputs haven't changed.
+
+        Args:
+            path (str): the path to the json manifest file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            with open(path) as f:
+                self.fingerprints = json.load(f)
+        else:
+            self.fingerprints = {}
+
+    def is_current(self, spec):
+        """Check if a figure is already rendered from the same inputs."""
+        return (os.path.exists(spec["path"]) and
+                self.fingerprints.get(spec["path"]) == spec["fingerprint"])
+
+    def update(self, spec):
+        """Record the fingerprint of a rendered figure."""
+        self.fingerprints[spec["path"]] = spec["fingerprint"]
+
+    def save(self):
+        """Atomically write the manifest to disk."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.fingerprints, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _downsample_pair(x, y, n_out, method):
+    """Downsample a pair of x and y Series to about n_out points."""
+    if method is None or len(y) <= n_out:
+        return x, y
+    x_values, y_values = downsample(x.values, y.values, n_out, method=method)
+    return Series(x_values, x.attrs), Series(y_values, y.attrs)
+
+
+@timed("render.plot_spec")
+def plot_spec(x1, y1, c1, x2, y2, c2, path, title=None, dpi=300,
+              method="minmax", max_points=None):
+    """
+    Build the specification of a two-axis figure for render_figures. Each
+    series is downsampled to about the pixel width of the figure, so the
+    cost of rendering depends on the figure size rather than the length of
+    the data.
+
+        Args:
+            x1, y1 (xarray.DataArray): the x and y data of the first axis
+            c1 (str): the color of the first line
+            x2, y2 (xarray.DataArray): the x and y data of the second axis
+            c2 (str): the color of the second line
+            path (str): the file to save the figure to
+            title (str): Optional. The title of the figure.
+            dpi (int): the resolution of the saved figure
+            method (str): the downsampling method, "minmax" (which keeps
+                the extremes) or "lttb", or None to plot every point
+            max_points (int): Optional. The number of points to keep in each
+                series. Defaults to the width of the figure in pixels.
+
+        Returns:
+            spec (dict): a picklable specification of the figure
+    """
+    if max_points is None:
+        max_points = int(FIGSIZE[0] * dpi)
+    x1, y1, x2, y2 = [to_series(da) for da in (x1, y1, x2, y2)]
+
+    # Fingerprint the full input data before downsampling it
+    params = {
+        "c1": c1, "c2": c2, "title": title, "path": path, "dpi": dpi,
+        "method": method, "max_points": max_points, "figsize": FIGSIZE,
+        "labels": [series.attrs for series in (x1, y1, x2, y2)]
+    }
+    fingerprint = data_fingerprint([x1, y1, x2, y2], params)
+
+    x1, y1 = _downsample_pair(x1, y1, max_points, method)
+    x2, y2 = _downsample_pair(x2, y2, max_points, method)
+    return {
+        "x1": x1,
+        "y1": y1,
+        "c1": c1,
+        "x2": x2,
+        "y2": y2,
+        "c2": c2,
+        "title": title,
+        "path": path,
+        "dpi": dpi,
+        "fingerprint": fingerprint
+    }
+
+
+def render_figure(spec):
+    """
+    Render a figure specification and save it, reusing the figure of the
+    current process. Returns the path of the saved figure and the seconds
+    spent saving it, which are recorded by the calling process, since
+    metrics recorded in a worker process would never reach it.
+    """
+    global _figure
+    if _figure is None:
+        _figure = plt.figure(figsize=FIGSIZE)
+
+    fig = plot_ts(spec["x1"], spec["y1"], spec["c1"], spec["x2"],
+                  spec["y2"], spec["c2"], title=spec["title"], fig=_figure)
+
+    # Write to a temporary file and move it into place, so the figure is
+    # never picked up half-written
+    path = spec["path"]
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    root, ext = os.path.splitext(path)
+    tmp_path = root + ".tmp" + ext
+    start = time.perf_counter()
+    fig.savefig(tmp_path, dpi=spec["dpi"])
+    seconds = time.perf_counter() - start
+    os.replace(tmp_path, path)
+
+    # Release the artists, keeping the figure for the next render
+    fig.clf()
+    return path, seconds
+
+
+def _record_render(result):
+    """Record the savefig time of a rendered figure and return its path."""
+    path, seconds = result
+    get_metrics().observe("render.savefig", seconds)
+    return path
+
+
+class Renderer():
+    """
+    Renders batches of figure specifications in a pool of worker processes,
+    each of which reuses a single figure. The pool is kept between batches,
+    so a long-running service doesn't pay for starting the workers (and
+    importing matplotlib) on every batch.
+
+        Args:
+            max_workers (int): Optional. The number of worker processes.
+                Set to 1 to render in the current process. Defaults to the
+                number of CPUs.
+
+    The workers re-import the main module, so scripts using a pool must
+    guard their entry point with if __name__ == '__main__'.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def _start_pool(self):
+        """
+        Start the worker processes. The pool is started lazily from threads
+        of a process which already runs HTTP and poller threads, and forking
+        a multithreaded process can deadlock, so the workers are started
+        from a forkserver (or spawned where it isn't available).
+        """
+        methods = multiprocessing.get_all_start_methods()
+        method = "forkserver" if "forkserver" in methods else "spawn"
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(method))
+
+    @timed("render.render")
+    def render(self, specs, manifest=None):
+        """
+        Render and save a batch of figure specifications.
+
+            Args:
+                specs (list): figure specifications from plot_spec
+                manifest (str): Optional. Path to a json manifest of the
+                    fingerprints of rendered figures. Figures whose
+                    fingerprint matches the manifest are not rendered again.
+
+            Returns:
+                paths (list): the paths of the figures which were rendered
+        """
+        metrics = get_metrics()
+        if manifest is not None:
+            manifest = PlotManifest(manifest)
+            total = len(specs)
+            specs = [spec for spec in specs if not manifest.is_current(spec)]
+            metrics.count("figures", total - len(specs), status="skipped")
+        metrics.count("figures", len(specs), status="rendered")
+
+        if self.max_workers == 1 or len(specs) <= 1:
+            paths = [_record_render(render_figure(spec)) for spec in specs]
+        else:
+            if self.executor is None:
+                self.executor = self._start_pool()
+            paths = [_record_render(result) for result in
+                     self.executor.map(render_figure, specs)]
+
+        if manifest is not None and len(specs) > 0:
+            for spec in specs:
+                manifest.update(spec)
+            manifest.save()
+
+        return paths
+
+    def submit(self, spec):
+        """
+        Render and save a single figure specification in the background,
+        e.g. as soon as its data is ready. Figures rendered in the current
+        process (max_workers=1) are rendered one at a time.
+
+            Returns:
+                future (concurrent.futures.Future): resolves to the path of
+                    the rendered figure
+        """
+        if self.max_workers == 1:
+            future = Future()
+            with self.lock:
+                try:
+                    future.set_result(_record_render(render_figure(spec)))
+                except Exception as exc:
+                    future.set_exception(exc)
+            return future
+
+        with self.lock:
+            if self.executor is None:
+                self.executor = self._start_pool()
+        rendering = self.executor.submit(render_figure, spec)
+
+        # Resolve to the path, recording the savefig time in this process
+        future = Future()
+
+        def rendered(rendering):
+            try:
+                future.set_result(_record_render(rendering.result()))
+            except Exception as exc:
+                future.set_exception(exc)
+
+        rendering.add_done_callback(rendered)
+        return future
+
+    def close(self):
+        """Shut down the worker processes."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def render_figures(specs, max_workers=None, manifest=None):
+    """
+    Render and save a batch of figure specifications in parallel, skipping
+    figures which are unchanged according to the manifest (if given).
+    """
+    renderer = Renderer(max_workers=max_workers)
+    try:
+        return renderer.render(specs, manifest=manifest)
+    finally:
+        renderer.close()
@@ -0,0 +1,84 @@
+import time
+import signal
+import threading
+import traceback
+
+
+class Scheduler():
+    """
+    Runs a job on a fixed interval from a long-running process. Runs are
+    aligned to multiples of the interval (plus an offset) since the epoch,
+    e.g. every two hours on the hour to follow the buoy telemetry, and never
+    overlap: a run which is due, or triggered, while another is in progress
+    starts once it finishes.
+
+        Args:
+            job (callable): the function to run, which takes no arguments
+            interval (float): seconds between runs
+            offset (float): seconds after each interval boundary to run, e.g.
+                to give the telemetered data time to arrive
+            run_at_start (bool): Set to True to run once immediately on start.
+    """
+
+    def __init__(self, job, interval, offset=0, run_at_start=True):
+
+        self.job = job
+        self.interval = interval
+        self.offset = offset
+        self.run_at_start = run_at_start
+        self.event = threading.Event()
+        self.stopping = False
+        self.triggered = False
+
+    def next_run(self, now=None):
+        """Return the time of the next aligned run after now."""
+        if now is None:
+            now = time.time()
+        boundary = (now - self.offset) // self.interval
+        return (boundary + 1) * self.interval + self.offset
+
+    def trigger(self):
+        """Request a run now (or as soon as the current run finishes)."""
+        self.triggered = True
+        self.event.set()
+
+    def stop(self):
+        """Stop the scheduler once the current run (if any) finishes."""
+        self.stopping = True
+        self.event.set()
+
+    def install_signal_handlers(self):
+        """
+        Stop gracefully on SIGTERM and SIGINT, and run now on SIGUSR1. Must
+        be called from the main thread.
+        """
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.stop())
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.trigger())
+
+    def _run_job(self):
+        """Run the job, logging rather than raising any error."""
+        start = time.time()
+        print(f'Run started at {time.strftime("%Y-%m-%d %H:%M:%S")}')
+        try:
+            self.job()
+        except Exception:
+            traceback.print_exc()
+        print(f'Run finished in {time.time() - start:.1f} s')
+
+    def run(self):
+        """Run the job on schedule until stopped."""
+        self.triggered = self.run_at_start
+        while not self.stopping:
+            due = self.next_run()
+            # Wait until the next run is due or a run is triggered
+            while not self.stopping and not self.triggered:
+                remaining = due - time.time()
+                if remaining <= 0:
+                    break
+                self.event.wait(remaining)
+                self.event.clear()
+            if self.stopping:
+                break
+            self.triggered = False
+            self._run_job()
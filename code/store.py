@@ -0,0 +1,215 @@
+import os
+import glob
+import threading
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def merge_datasets(retained, new, window_start=None):
+    """
+    Merge newly requested data into a retained dataset, dropping duplicated
+    timestamps (keeping the newest record) and trimming to a time window.
+
+        Args:
+            retained (xarray.Dataset): the previously retained dataset with
+                time as the main dimension, or None
+            new (xarray.Dataset): the newly requested dataset, or None
+            window_start (datetime): Optional. Records before this time are
+                dropped from the merged dataset.
+
+        Returns:
+            merged (xarray.Dataset): the merged dataset sorted by time
+    """
+    datasets = [ds for ds in (retained, new) if ds is not None]
+    if len(datasets) == 0:
+        return None
+
+    # The obs coordinate is a per-file index and isn't meaningful across
+    # requests, so drop it before concatenating along time
+    datasets = [ds.drop_vars("obs", errors="ignore") for ds in datasets]
+    if len(datasets) > 1:
+        merged = xr.concat(datasets, dim="time", data_vars="minimal",
+                           coords="minimal", compat="override",
+                           combine_attrs="override")
+    else:
+        merged = datasets[0]
+
+    # Remove duplicated records, keeping the most recently requested
+    duplicated = merged.get_index("time").duplicated(keep="last")
+    if duplicated.any():
+        merged = merged.isel(time=~duplicated)
+    merged = merged.sortby("time")
+
+    if window_start is not None:
+        merged = merged.sel(time=slice(pd.to_datetime(window_start), None))
+
+    return merged
+
+
+class TimeSeriesStore():
+    """
+    Local append-only store of OOINet data streams. Each stream is kept under
+    <root>/<refdes>/<stream>/ as daily time partitions, written as compressed
+    and chunked netCDF4 files, so that appending new data only rewrites the
+    partitions it touches and time-range reads only open the partitions in
+    range.
+
+        Args:
+            root (str): the root directory of the store
+            complevel (int): the zlib compression level of the partitions
+            chunk_size (int): the number of records per chunk along time
+    """
+
+    def __init__(self, root, complevel=4, chunk_size=4096):
+
+        self.root = root
+        self.complevel = complevel
+        self.chunk_size = chunk_size
+        # The HDF5 library isn't thread-safe, so every read and write of
+        # the partitions is made under the lock (reentrant, since append
+        # reads the partitions it rewrites)
+        self.lock = threading.RLock()
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    def _stream_dir(self, refdes, stream):
+        return os.path.join(self.root, refdes, stream)
+
+    def _partition_path(self, refdes, stream, day):
+        return os.path.join(self._stream_dir(refdes, stream),
+                            day.strftime("%Y-%m-%d") + ".nc")
+
+    def partitions(self, refdes, stream, start=None, end=None):
+        """
+        List the partition files of a stream, optionally limited to those
+        overlapping the start and end times.
+        """
+        files = sorted(glob.glob(os.path.join(self._stream_dir(refdes, stream),
+                                              "????-??-??.nc")))
+        if start is not None:
+            start = pd.to_datetime(start).floor("D")
+        if end is not None:
+            end = pd.to_datetime(end).floor("D")
+        selected = []
+        for file in files:
+            day = pd.to_datetime(os.path.basename(file)[:-3])
+            if start is not None and day < start:
+                continue
+            if end is not None and day > end:
+                continue
+            selected.append(file)
+        return selected
+
+    def _encoding(self, ds):
+        """Build the compression and chunking encoding for a partition."""
+        encoding = {}
+        for name, var in ds.data_vars.items():
+            if var.dtype.kind not in "biuf":
+                continue
+            encoding[name] = {"zlib": True, "complevel": self.complevel}
+            if len(var.dims) > 0 and var.dims[0] == "time":
+                chunks = [min(self.chunk_size, var.shape[0])]
+                chunks.extend(var.shape[1:])
+                encoding[name]["chunksizes"] = tuple(chunks)
+        return encoding
+
+    def _write_partition(self, ds, path):
+        """Atomically write a partition file of loaded data."""
+        # Drop the encodings carried over from the source files, which
+        # aren't valid for a new file
+        for var in ds.variables:
+            ds[var].encoding = {}
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = path + ".tmp"
+        ds.to_netcdf(tmp_path, format="NETCDF4", encoding=self._encoding(ds))
+        os.replace(tmp_path, path)
+
+    def _read_partition(self, path, variables=None):
+        with self.lock, xr.open_dataset(path) as ds:
+            if variables is not None:
+                ds = ds[variables]
+            ds = ds.load()
+        return ds
+
+    def append(self, ds, refdes, stream):
+        """
+        Append a dataset with time as the main dimension to the store.
+        Records with timestamps already in the store replace the stored
+        records.
+
+            Args:
+                ds (xarray.Dataset): the data to append
+                refdes (str): the reference designator of the data
+                stream (str): the stream of the data
+        """
+        if ds is None or ds.sizes.get("time", 0) == 0:
+            return
+
+        # Load lazily-opened data (e.g. from OpenDAP) before taking the lock,
+        # so a slow download doesn't hold up the other streams
+        ds = ds.load()
+        days = ds.get_index("time").floor("D")
+        for day in np.unique(days):
+            day = pd.Timestamp(day)
+            new = ds.isel(time=np.flatnonzero(days == day))
+            path = self._partition_path(refdes, stream, day)
+            with self.lock:
+                retained = None
+                if os.path.exists(path):
+                    retained = self._read_partition(path)
+                self._write_partition(merge_datasets(retained, new), path)
+
+    def read(self, refdes, stream, start=None, end=None, variables=None):
+        """
+        Read a time range of a stream from the store.
+
+            Args:
+                refdes (str): the reference designator of the data
+                stream (str): the stream of the data
+                start (datetime): Optional. The start of the time range.
+                end (datetime): Optional. The end of the time range.
+                variables (list): Optional. The variables to read. Defaults
+                    to all variables.
+
+            Returns:
+                ds (xarray.Dataset): the data with time as the main
+                    dimension, or None if there is no data in the range
+        """
+        files = self.partitions(refdes, stream, start=start, end=end)
+        if len(files) == 0:
+            return None
+
+        datasets = [self._read_partition(file, variables) for file in files]
+        if len(datasets) > 1:
+            ds = xr.concat(datasets, dim="time", data_vars="minimal",
+                           coords="minimal", compat="override",
+                           combine_attrs="override")
+        else:
+            ds = datasets[0]
+
+        if start is not None or end is not None:
+            start = pd.to_datetime(start) if start is not None else None
+            end = pd.to_datetime(end) if end is not None else None
+            ds = ds.sel(time=slice(start, end))
+
+        return ds
+
+    def last_time(self, refdes, stream):
+        """Return the last timestamp in the store for a stream, or None."""
+        files = self.partitions(refdes, stream)
+        if len(files) == 0:
+            return None
+        with self.lock, xr.open_dataset(files[-1]) as ds:
+            return pd.to_datetime(ds.time.values.max())
+
+    def prune(self, refdes, stream, before):
+        """Remove the partitions of a stream entirely before a time."""
+        before = pd.to_datetime(before).floor("D")
+        with self.lock:
+            for file in self.partitions(refdes, stream):
+                day = pd.to_datetime(os.path.basename(file)[:-3])
+                if day < before:
+                    os.remove(file)
@@ -0,0 +1,212 @@
+import os
+import json
+import datetime
+import threading
+import pandas as pd
+from store import TimeSeriesStore, merge_datasets
+from polling import ThreddsTimeoutError
+from metrics import get_metrics, timed
+
+
+class SyncState():
+    """
+    High-water marks of the last successfully processed timestamp for each
+    reference designator, method, and stream, persisted to a json file.
+
+        Args:
+            path (str): the path to the json file holding the marks
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.marks = json.load(f)
+        else:
+            self.marks = {}
+
+    def _key(self, refdes, method, stream):
+        return "/".join((refdes, method, stream))
+
+    def get(self, refdes, method, stream):
+        """Return the high-water mark for a stream, or None if not synced."""
+        mark = self.marks.get(self._key(refdes, method, stream))
+        if mark is not None:
+            mark = pd.to_datetime(mark)
+        return mark
+
+    def update(self, refdes, method, stream, mark):
+        """Set the high-water mark for a stream and save the state."""
+        with self.lock:
+            self.marks[self._key(refdes, method, stream)] = \
+                pd.to_datetime(mark).isoformat()
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.marks, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class IncrementalSync():
+    """
+    Incrementally sync OOINet data streams into a local time-series store.
+    Each sync only requests data newer than the stream's high-water mark
+    (minus a small overlap), appends it to the store, prunes the days which
+    have left the retained window from the store, and returns the retained
+    window of data read back from the store.
+
+        Args:
+            ooinet (OOINet): an initialized OOINet tool
+            data_dir (str): the directory in which to keep the sync state
+                and, unless a store is given, the time-series store
+            window (datetime.timedelta): the length of the retained window
+            overlap (datetime.timedelta): how far before the high-water mark
+                to start each request, to catch late-arriving records
+            store (TimeSeriesStore): Optional. The store in which to keep
+                the data. Defaults to a store under data_dir.
+    """
+
+    def __init__(self, ooinet, data_dir, window=datetime.timedelta(hours=48),
+                 overlap=datetime.timedelta(hours=1), store=None):
+
+        self.ooinet = ooinet
+        self.data_dir = data_dir
+        self.window = window
+        self.overlap = overlap
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        self.state = SyncState(os.path.join(data_dir, "sync_state.json"))
+        if store is None:
+            store = TimeSeriesStore(os.path.join(data_dir, "store"))
+        self.store = store
+
+    def get_begin_time(self, refdes, method, stream, now=None):
+        """
+        Get the beginDT for the next request of a stream: the high-water
+        mark minus the overlap, but no earlier than the start of the window.
+        """
+        if now is None:
+            now = datetime.datetime.utcnow()
+        window_start = pd.to_datetime(now - self.window)
+        # The mark is only used if the store still holds the partition
+        # of the mark, which is checked without opening it
+        mark = self.state.get(refdes, method, stream)
+        if mark is None or len(self.store.partitions(
+                refdes, stream, start=mark, end=mark)) == 0:
+            return window_start
+        return max(window_start, mark - self.overlap)
+
+    @timed("sync.request")
+    def request(self, refdes, method, stream, now=None):
+        """
+        Submit the asynchronous data request for the data since the last
+        sync of a stream, without waiting for it to finish.
+
+            Returns:
+                request (dict): the stream, its window start, and the THREDDS
+                    url of the submitted request (None if there is no data)
+        """
+        if now is None:
+            now = datetime.datetime.utcnow()
+        window_start = pd.to_datetime(now - self.window)
+        beginDT = self.get_begin_time(refdes, method, stream, now=now)
+
+        # Request only the data since the last sync
+        thredds_url = self.ooinet.get_thredds_url(refdes=refdes, method=method,
+                                                  stream=stream,
+                                                  beginDT=beginDT)
+        return {
+            "refdes": refdes,
+            "method": method,
+            "stream": stream,
+            "window_start": window_start,
+            "beginDT": beginDT,
+            "thredds_url": thredds_url
+        }
+
+    @timed("sync.complete")
+    def complete(self, request, exclude=[], variables=None):
+        """
+        Wait for a submitted data request to finish, load the new data, and
+        merge it into the retained window.
+
+            Args:
+                request (dict): a request returned by IncrementalSync.request
+                exclude (list): keywords to filter files out of the THREDDS
+                    catalog
+                variables (list): Optional. The variables to load. Defaults
+                    to all of the variables.
+
+            Returns:
+                ds (xarray.Dataset): the retained window of data for the
+                    stream, or None if there is no data
+        """
+        refdes = request["refdes"]
+        method = request["method"]
+        stream = request["stream"]
+        window_start = request["window_start"]
+        metrics = get_metrics()
+        with metrics.span("sync.read_store", stream=stream):
+            retained = self.store.read(refdes, stream, start=window_start)
+
+        new = None
+        if request["thredds_url"] is not None:
+            try:
+                catalog = self.ooinet.get_thredds_catalog(
+                    request["thredds_url"])
+            except ThreddsTimeoutError as exc:
+                # Fall back on the retained window
+                print(exc)
+                metrics.count("thredds_timeouts", stream=stream)
+                catalog = None
+            if catalog is not None:
+                catalog = self.ooinet.parse_catalog(catalog, exclude=exclude)
+                if len(catalog) > 0:
+                    new = self.ooinet.load_netCDF_files(
+                        catalog, variables=variables,
+                        beginDT=request["beginDT"])
+
+        # Load the new data once, rather than reading it from THREDDS again
+        # on every access of the returned window
+        if new is not None:
+            with metrics.span("sync.load", stream=stream):
+                new = new.load()
+
+        # Save the new data, drop the partitions which have left the window,
+        # and advance the high-water mark
+        with metrics.span("sync.merge", stream=stream):
+            self.store.append(new, refdes, stream)
+            self.store.prune(refdes, stream, window_start)
+            ds = merge_datasets(retained, new, window_start=window_start)
+        if ds is None:
+            return None
+        if ds.sizes.get("time", 0) > 0:
+            self.state.update(refdes, method, stream, ds.time.values.max())
+
+        return ds
+
+    def sync(self, refdes, method, stream, exclude=[], variables=None,
+             now=None):
+        """
+        Request the new data for a stream and merge it into the retained
+        window.
+
+            Args:
+                refdes (str): reference designator for the instrument
+                method (str): the method (i.e. telemetered) for the given
+                    reference designator
+                stream (str): the stream associated with the reference
+                    designator and method
+                exclude (list): keywords to filter files out of the THREDDS
+                    catalog
+                variables (list): Optional. The variables to load. Defaults
+                    to all of the variables.
+                now (datetime): Optional. The end of the window, defaults to
+                    the current (UTC) time.
+
+            Returns:
+                ds (xarray.Dataset): the retained window of data for the
+                    stream, or None if there is no data
+        """
+        request = self.request(refdes, method, stream, now=now)
+        return self.complete(request, exclude=exclude, variables=variables)
@@ -0,0 +1,249 @@
+"""
+Vectorized conversions between the timestamp formats used by OOINet and
+numpy datetime64[ns]:
+
+    NTP seconds     float seconds since 1900-01-01 (the raw OOI time variable)
+    epoch millis    milliseconds since 1970-01-01 (deployment event times)
+    ISO 8601        strings such as "2020-08-04T12:00:00.000Z" (M2M requests)
+
+Every conversion takes a scalar or array and returns an array (0-d for a
+scalar), works on whole arrays in NumPy without a Python loop, and maps
+missing values (None, NaN, NaT) to NaT or NaN.
+"""
+import datetime
+import numpy as np
+
+
+# Nanoseconds between the NTP (1900) and unix (1970) epochs
+NTP_OFFSET_NS = np.int64(2208988800) * 10**9
+
+NS_PER_UNIT = {
+    "s": 10**9,
+    "ms": 10**6,
+    "us": 10**3,
+    "ns": 1
+}
+
+
+def _as_float(values):
+    """Convert values to a float64 array, with None as NaN."""
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = np.where(np.equal(values, None), np.nan, values)
+    return values.astype("float64")
+
+
+def _to_datetime64(values, unit, offset_ns=0):
+    """Convert numeric times since an epoch into datetime64[ns]."""
+    values = np.asarray(values)
+    scale = NS_PER_UNIT[unit]
+
+    # Integer times convert exactly
+    if values.dtype.kind in "iu":
+        ns = np.asarray(values.astype("int64") * scale - offset_ns)
+        return ns.view("datetime64[ns]")
+
+    # Split floats into whole and fractional units, so large times keep
+    # their sub-unit precision
+    values = _as_float(values)
+    missing = ~np.isfinite(values)
+    values = np.where(missing, 0, values)
+    whole = np.floor(values)
+    fraction = np.round((values - whole) * scale)
+    ns = np.asarray(whole.astype("int64") * scale +
+                    fraction.astype("int64") - offset_ns)
+    times = ns.view("datetime64[ns]")
+    times[missing] = np.datetime64("NaT")
+    return times
+
+
+def _from_datetime64(times, unit, offset_ns=0):
+    """Convert datetime64 times into float times since an epoch."""
+    times = np.asarray(times, dtype="datetime64[ns]")
+    missing = np.isnat(times)
+    ns = times.view("int64") + offset_ns
+    values = np.asarray(ns / NS_PER_UNIT[unit])
+    values[missing] = np.nan
+    return values
+
+
+def ntp_to_datetime64(seconds):
+    """Convert NTP seconds since 1900-01-01 into datetime64[ns]."""
+    return _to_datetime64(seconds, "s", offset_ns=NTP_OFFSET_NS)
+
+
+def datetime64_to_ntp(times):
+    """Convert datetimes into float NTP seconds since 1900-01-01."""
+    return _from_datetime64(times, "s", offset_ns=NTP_OFFSET_NS)
+
+
+def epoch_to_datetime64(values, unit="ms"):
+    """
+    Convert times since the unix epoch into datetime64[ns].
+
+        Args:
+            values (array): the times, e.g. epoch milliseconds
+            unit (str): the unit of the times, "s", "ms", "us", or "ns"
+
+        Returns:
+            times (numpy.ndarray): the datetime64[ns] times
+    """
+    return _to_datetime64(values, unit)
+
+
+def datetime64_to_epoch(times, unit="ms"):
+    """Convert datetimes into float times since the unix epoch."""
+    return _from_datetime64(times, unit)
+
+
+# The rows of character codes parsed at a time, so each chunk stays in cache
+_CHUNK_ROWS = 1 << 14
+
+# The days from 1970-01-01 to the start of each month of the years 0-9999,
+# indexed by year * 12 + month - 1, built on first use
+_month_starts = None
+
+
+def _get_month_starts():
+    global _month_starts
+    if _month_starts is None:
+        months = np.arange(10000 * 12 + 1) - 1970 * 12
+        _month_starts = months.astype("datetime64[M]").astype(
+            "datetime64[D]").astype("int64")
+    return _month_starts
+
+
+def _parse_iso_fixed(chars):
+    """
+    Parse ISO 8601 strings, as a 2-d array of character codes, which are all
+    laid out as YYYY-MM-DD[THH:MM:SS[.f...]][Z] (or empty) with arithmetic
+    on the digits. Returns the nanoseconds since the unix epoch and the
+    empty strings, or None if the strings aren't laid out that way or hold
+    an invalid date.
+    """
+    n, width = chars.shape
+    if chars.max() > 127:
+        return None
+    empty = chars[:, 0] == 0
+    rows = np.flatnonzero(~empty)
+    if len(rows) == 0:
+        return np.zeros(n, dtype="int64"), empty
+
+    # Every string must have the length and layout of the first
+    length = int(np.count_nonzero(chars[rows[0]]))
+    if length < width and (chars[:, length] != 0).any():
+        return None
+    end = length
+    if chars[rows[0], length - 1] == ord("Z"):
+        end = length - 1
+    if end not in (10, 19) and not 21 <= end <= 29:
+        return None
+    layout = "0000-00-00T00:00:00." + "0" * 9
+    layout = layout[:end] + "Z" * (length - end)
+    expected = np.frombuffer(layout.encode(), dtype=np.uint8)[:, None]
+
+    # Work on the characters column by column
+    columns = chars[:, :length].T.astype(np.uint8)
+    if end > 10:
+        # Accept a space between the date and time too
+        columns[10, columns[10] == ord(" ")] = ord("T")
+    if len(rows) < n:
+        columns[:, empty] = expected
+
+    # The digits wrap around to large values for anything but a digit, and
+    # the separators must match exactly
+    digits = columns - expected
+    limit = np.where(expected == ord("0"), 9, 0).astype(np.uint8)
+    if (digits > limit).any():
+        return None
+
+    def number(start, stop):
+        value = digits[start].astype(np.int32)
+        for column in range(start + 1, min(stop, end)):
+            value *= 10
+            value += digits[column]
+        return value
+
+    year, month, day = number(0, 4), number(5, 7), number(8, 10)
+    if ((month < 1) | (month > 12) | (day < 1)).any():
+        return None
+
+    # Look up the start of each month, and check the days fit the months
+    month_starts = _get_month_starts()
+    index = year * 12 + month - 1
+    days = month_starts[index]
+    if (day > month_starts[index + 1] - days).any():
+        return None
+    seconds = (days + day - 1) * 86400
+
+    if end > 10:
+        hour, minute, second = number(11, 13), number(14, 16), number(17, 19)
+        if ((hour > 23) | (minute > 59) | (second > 59)).any():
+            return None
+        seconds += hour * 3600 + minute * 60 + second
+    ns = seconds * 10**9
+    if end > 20:
+        ns += number(20, end) * 10**(29 - end)
+    return ns, empty
+
+
+def iso_to_datetime64(strings):
+    """
+    Parse ISO 8601 strings (optionally ending in "Z" for UTC) into
+    datetime64[ns], with None or empty strings as NaT.
+    """
+    strings = np.asarray(strings)
+    # Only object arrays (e.g. holding None) are converted element-wise
+    if strings.dtype == object:
+        strings = np.where(np.equal(strings, None), "", strings)
+    if strings.dtype.kind not in "US":
+        strings = strings.astype(str)
+    if strings.size == 0:
+        return strings.astype("datetime64[ns]")
+
+    # Parse strings with the usual fixed layout from their character codes
+    flat = np.ascontiguousarray(strings).reshape(-1)
+    chars = flat.view(np.uint32 if flat.dtype.kind == "U" else np.uint8)
+    chars = chars.reshape(len(flat), -1)
+    ns = np.empty(len(flat), dtype="int64")
+    missing = np.empty(len(flat), dtype=bool)
+    for start in range(0, len(flat), _CHUNK_ROWS):
+        parsed = _parse_iso_fixed(chars[start:start + _CHUNK_ROWS])
+        if parsed is None:
+            break
+        ns[start:start + _CHUNK_ROWS], missing[start:start + _CHUNK_ROWS] = \
+            parsed
+    else:
+        times = ns.view("datetime64[ns]")
+        times[missing] = np.datetime64("NaT")
+        return times.reshape(strings.shape)
+
+    # Otherwise NumPy parses ISO 8601 itself, but deprecates timezone
+    # designators, so blank out the "Z" in a copy of the characters
+    # (trailing NULs are ignored, and "Z" can't appear anywhere else)
+    chars = chars.copy()
+    chars[chars == ord("Z")] = 0
+    strings = chars.reshape(-1).view(flat.dtype).reshape(strings.shape)
+    return strings.astype("datetime64[ns]")
+
+
+def to_datetime64(values):
+    """
+    Convert ISO 8601 strings, datetimes (naive as UTC, or timezone-aware),
+    or datetime64s into datetime64[ns].
+    """
+    if isinstance(values, datetime.datetime) and values.tzinfo is not None:
+        values = values.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    values = np.asarray(values)
+    if values.dtype.kind in "US":
+        return iso_to_datetime64(values)
+    return values.astype("datetime64[ns]")
+
+
+def datetime64_to_iso(times, unit="ms"):
+    """
+    Format datetimes as ISO 8601 UTC strings as OOINet expects them, e.g.
+    "2020-08-04T12:00:00.000Z".
+    """
+    times = np.asarray(times, dtype="datetime64[ns]")
+    return np.datetime_as_string(times, unit=unit, timezone="UTC")
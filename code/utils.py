@@ -1,54 +1,262 @@
 import re
 import os
+import json
 import time
+import tempfile
+import threading
 import requests
-import datetime
+from email.utils import parsedate_to_datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache import ResponseCache
+from polling import ThreddsPoller, ThreddsTimeoutError
+from parameters import get_registry
+from catalog import iter_catalog, compile_filter
+from metrics import get_metrics, timed
+from derived import REGISTRY as DERIVED
+from jobs import JobRegistry
+from timestamps import (epoch_to_datetime64, to_datetime64,
+                        datetime64_to_iso)
 import numpy as np
 import pandas as pd
-import xarray as xr
-from xml.dom import minidom
-from urllib.request import urlopen
-from urllib.request import urlretrieve
-import matplotlib.pyplot as plt
+
+# Note: xarray (and netCDF4) are only imported by the methods which load
+# data, so that metadata lookups don't pay for importing the scientific
+# stack. code/benchmarks/import_time.py checks this.
+
+
+class RateLimiter():
+    """
+    Simple thread-safe token bucket which limits the rate at which requests
+    are sent to OOINet from the client side.
+
+        Args:
+            rate (float): the sustained number of requests per second allowed
+            burst (int): the number of requests which may be sent back-to-back
+                before the rate limit applies
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(int(burst), 1)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until a request is allowed to be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Refill the bucket based on the time elapsed
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.last)*self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
 
 
 class OOINet():
 
-    def __init__(self, USERNAME, TOKEN):
+    # Default number of seconds for which responses from each class of
+    # endpoint are kept in the response cache. Endpoints which are not listed
+    # are never cached.
+    CACHE_TTL = {
+        'vocab': 7*24*3600,
+        'preload': 7*24*3600,
+        'deploy': 6*3600,
+        'data': 12*3600,
+    }
+
+    # Number of parsed THREDDS catalogs kept for conditional requests. Each
+    # data request has its own catalog, so only recent ones are worth it.
+    CATALOG_CACHE_SIZE = 32
+
+    # The (connect, read) timeout of THREDDS job status checks
+    STATUS_TIMEOUT = (5, 10)
+
+    def __init__(self, USERNAME, TOKEN, pool_size=10, timeout=(10, 120),
+                 max_retries=5, backoff_factor=1, rate_limit=None,
+                 cache_dir=None, cache_size=256*1024**2, cache_ttl=None,
+                 refresh_cache=False, job_ttl=24*3600, job_max_lag=10*60,
+                 m2m_url='https://ooinet.oceanobservatories.org/api/m2m',
+                 thredds_server='https://opendap.oceanobservatories.org/thredds/'):
+        """
+        Initialize the OOINet tool with a single pooled http session which is
+        reused for every request made to OOINet and the THREDDS server.
+
+            Args:
+                USERNAME (str): OOINet API username
+                TOKEN (str): OOINet API token
+                pool_size (int): number of keep-alive connections to hold open
+                    per host
+                timeout (float or tuple): the (connect, read) timeout in
+                    seconds applied to every request
+                max_retries (int): number of times to retry a request which
+                    fails on a connection error or a 429/5xx response
+                backoff_factor (float): the exponential backoff factor between
+                    retries, i.e. sleeps of {backoff_factor} * 2^(retry-1) s
+                rate_limit (float): Optional. Maximum number of requests per
+                    second to send. Defaults to no limit.
+                cache_dir (str): Optional. Directory of the on-disk cache of
+                    API responses. Defaults to no caching.
+                cache_size (int): maximum size in bytes of the response cache
+                cache_ttl (dict): Optional. Overrides of the number of seconds
+                    responses are cached for each endpoint in self.urls,
+                    e.g. {'deploy': 3600}
+                refresh_cache (bool): Set to True to bypass cached responses
+                    and refresh the cache with new requests.
+                job_ttl (float): the number of seconds for which a completed
+                    data request is reused for requests it covers. Set to 0
+                    to only merge concurrent requests.
+                job_max_lag (float): the number of seconds of the newest data
+                    which a reused data request without an endDT may miss
+                m2m_url (str): the base url of the OOINet M2M api
+                thredds_server (str): the base url of the THREDDS server
+        """
 
         self.username = USERNAME
         self.token = TOKEN
-        self.urls = {
-            'data': 'https://ooinet.oceanobservatories.org/api/m2m/12576/sensor/inv',
-            'anno': 'https://ooinet.oceanobservatories.org/api/m2m/12580/anno/find',
-            'vocab': 'https://ooinet.oceanobservatories.org/api/m2m/12586/vocab/inv',
-            'asset': 'https://ooinet.oceanobservatories.org/api/m2m/12587',
-            'deploy': 'https://ooinet.oceanobservatories.org/api/m2m/12587/events/deployment/inv',
-            'preload': 'https://ooinet.oceanobservatories.org/api/m2m/12575/parameter',
-            'cal': 'https://ooinet.oceanobservatories.org/api/m2m/12587/asset/cal'
-        }
+        self.timeout = timeout
+        self.session = self._build_session(pool_size, max_retries,
+                                           backoff_factor)
+        # Status checks are repeated by the poller anyway, so they aren't
+        # retried
+        self.status_session = self._build_session(pool_size, 0, 0)
+        if rate_limit is not None:
+            self.rate_limiter = RateLimiter(rate_limit, burst=pool_size)
+        else:
+            self.rate_limiter = None
+
+        # Set up the response cache
+        self.cache_ttl = dict(self.CACHE_TTL)
+        if cache_ttl is not None:
+            self.cache_ttl.update(cache_ttl)
+        self.refresh_cache = refresh_cache
+        if cache_dir is not None:
+            self.cache = ResponseCache(cache_dir, max_size=cache_size)
+        else:
+            self.cache = None
 
-    def _get_api(self, url):
-        """Request the given url from OOINet."""
-        r = requests.get(url, auth=(self.username, self.token))
-        data = r.json()
-        return data
+        # The parameter data levels are shared by every instance in the
+        # process, and persisted alongside the response cache
+        if cache_dir is not None:
+            self.parameters = get_registry(os.path.join(cache_dir,
+                                                        "parameters.json"))
+        else:
+            self.parameters = get_registry()
+
+        # Outstanding and completed data requests, by stream and window
+        self.jobs = JobRegistry(ttl=job_ttl, max_lag=job_max_lag)
 
-    def _ntp_seconds_to_datetime(self, ntp_seconds):
-        """Convert OOINet timestamps to unix-convertable timestamps."""
-        # Specify some constant needed for timestamp conversions
-        ntp_epoch = datetime.datetime(1900, 1, 1)
-        unix_epoch = datetime.datetime(1970, 1, 1)
-        ntp_delta = (unix_epoch - ntp_epoch).total_seconds()
+        # Parsed THREDDS catalogs, by catalog url
+        self._catalogs = OrderedDict()
+        self._catalogs_lock = threading.Lock()
 
-        return datetime.datetime.utcfromtimestamp(ntp_seconds - ntp_delta)
+        # The THREDDS job poller is started on first use
+        self._poller = None
+        self._poller_lock = threading.Lock()
+        self.thredds_server = thredds_server
+        self.urls = {
+            'data': f'{m2m_url}/12576/sensor/inv',
+            'anno': f'{m2m_url}/12580/anno/find',
+            'vocab': f'{m2m_url}/12586/vocab/inv',
+            'asset': f'{m2m_url}/12587',
+            'deploy': f'{m2m_url}/12587/events/deployment/inv',
+            'preload': f'{m2m_url}/12575/parameter',
+            'cal': f'{m2m_url}/12587/asset/cal'
+        }
 
-    def _convert_time(self, ms):
-        if ms is None:
+    def _build_session(self, pool_size, max_retries, backoff_factor):
+        """Build a keep-alive session which retries on 429/5xx errors."""
+        retry = Retry(total=max_retries, backoff_factor=backoff_factor,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _request(self, url, auth=True, method="GET", session=None,
+                 **kwargs):
+        """
+        Send a request through the shared session (or the given session),
+        applying the rate limiter and default timeout. Credentials are only
+        attached when auth is True so they are not sent to the THREDDS
+        server.
+        """
+        if session is None:
+            session = self.session
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        if auth:
+            kwargs.setdefault("auth", (self.username, self.token))
+        kwargs.setdefault("timeout", self.timeout)
+        metrics = get_metrics()
+        if not metrics.enabled:
+            return session.request(method, url, **kwargs)
+
+        # Count the request, its retries, and the bytes it returns
+        try:
+            r = session.request(method, url, **kwargs)
+        except requests.RequestException as exc:
+            metrics.count("http_errors", method=method,
+                          error=type(exc).__name__)
+            raise
+        metrics.count("http_requests", method=method, status=r.status_code)
+        retries = getattr(r.raw, "retries", None)
+        if retries is not None and len(retries.history) > 0:
+            metrics.count("http_retries", len(retries.history),
+                          method=method)
+        size = r.headers.get("Content-Length")
+        if size is not None and method != "HEAD":
+            metrics.count("http_response_bytes", int(size), method=method)
+        return r
+
+    def _get_ttl(self, url):
+        """Get the cache time-to-live for the endpoint a url belongs to."""
+        # Match the longest endpoint url, since some endpoints are nested
+        matches = [(len(base), key) for key, base in self.urls.items()
+                   if url.startswith(base)]
+        if len(matches) == 0:
             return None
-        else:
-            return datetime.datetime.utcfromtimestamp(ms/1000)
+        key = max(matches)[1]
+        return self.cache_ttl.get(key)
 
+    def _get_api(self, url, refresh=False):
+        """
+        Request the given url from OOINet. Responses from slow-changing
+        endpoints are served from the response cache when available, unless
+        refresh (or self.refresh_cache) is True.
+        """
+        ttl = None
+        if self.cache is not None:
+            ttl = self._get_ttl(url)
+        if ttl is not None and not (refresh or self.refresh_cache):
+            data = self.cache.get(url, ttl)
+            if data is not None:
+                get_metrics().count("cache_requests", cache="api",
+                                    result="hit")
+                return data
+            get_metrics().count("cache_requests", cache="api",
+                                result="miss")
+
+        r = self._request(url)
+        data = r.json()
+
+        # Only cache successful responses
+        if ttl is not None and r.status_code == requests.codes.ok:
+            self.cache.put(url, data)
+        return data
+
+    @timed("ooinet.get_metadata")
     def get_metadata(self, refdes):
         """
         Get the OOI Metadata for a specific instrument specified by its
@@ -96,7 +304,66 @@ class OOINet():
         # Return the results
         return results
 
-    def get_deployments(self, refdes, deploy_num="-1", results=pd.DataFrame()):
+    def _parse_deployments(self, deployments, refdes, columns=None):
+        """
+        Parse the deployment records returned by OOINet for an instrument
+        into a columnar dictionary of lists.
+        """
+        if columns is None:
+            columns = {
+                "refdes": [],
+                "deploymentNumber": [],
+                "latitude": [],
+                "longitude": [],
+                "depth": [],
+                "deployStart": [],
+                "deployEnd": [],
+                "deployCruise": [],
+                "recoverCruise": []
+            }
+
+        for deployment in deployments:
+            # Location info
+            location = deployment.get("location") or {}
+
+            # Cruise IDs of the deployment and recover cruises
+            deployCruiseInfo = deployment.get("deployCruiseInfo")
+            recoverCruiseInfo = deployment.get("recoverCruiseInfo")
+            if deployCruiseInfo is not None:
+                deployID = deployCruiseInfo["uniqueCruiseIdentifier"]
+            else:
+                deployID = None
+            if recoverCruiseInfo is not None:
+                recoverID = recoverCruiseInfo["uniqueCruiseIdentifier"]
+            else:
+                recoverID = None
+
+            columns["refdes"].append(refdes)
+            columns["deploymentNumber"].append(
+                deployment.get("deploymentNumber"))
+            columns["latitude"].append(location.get("latitude"))
+            columns["longitude"].append(location.get("longitude"))
+            columns["depth"].append(location.get("depth"))
+            columns["deployStart"].append(deployment.get("eventStartTime"))
+            columns["deployEnd"].append(deployment.get("eventStopTime"))
+            columns["deployCruise"].append(deployID)
+            columns["recoverCruise"].append(recoverID)
+
+        return columns
+
+    def _deployments_frame(self, columns):
+        """Build a typed dataframe from columnar deployment records."""
+        df = pd.DataFrame(columns)
+        df["deploymentNumber"] = df["deploymentNumber"].astype("int64")
+        for column in ["latitude", "longitude", "depth"]:
+            df[column] = df[column].astype("float64")
+        # Deployment start and end times are in milliseconds since 1970
+        for column in ["deployStart", "deployEnd"]:
+            df[column] = epoch_to_datetime64(df[column].values, unit="ms")
+        return df
+
+    @timed("ooinet.get_deployments")
+    def get_deployments(self, refdes, deploy_num="-1", results=None):
         """
         Get the deployment information for an instrument. Defaults to all
         deployments for a given instrument (reference designator) unless one is
@@ -129,51 +396,63 @@ class OOINet():
         # of dictionary objects with the deployment data.
         deployments = self._get_api(deploy_url)
 
-        # Now, iterate over the deployment list and get the associated data for
-        # each individual deployment
-        while len(deployments) > 0:
-            # Get a single deployment
-            deployment = deployments.pop()
+        # Parse the deployments into a typed dataframe
+        columns = self._parse_deployments(deployments, refdes)
+        df = self._deployments_frame(columns).drop(columns="refdes")
+        df = df.sort_values(by="deploymentNumber").reset_index(drop=True)
 
-            # Process the dictionary data
-            # Deployment Number
-            deploymentNumber = deployment.get("deploymentNumber")
+        if results is not None:
+            df = pd.concat([results, df], ignore_index=True)
 
-            # Location info
-            location = deployment.get("location")
-            depth = location["depth"]
-            lat = location["latitude"]
-            lon = location["longitude"]
+        return df
 
-            # Start and end times of the deployments
-            startTime = self._convert_time(deployment.get("eventStartTime"))
-            stopTime = self._convert_time(deployment.get("eventStopTime"))
+    @timed("ooinet.get_deployments_bulk")
+    def get_deployments_bulk(self, refdes_list, deploy_num="-1",
+                             max_workers=8):
+        """
+        Get the deployment information for many instruments at once. The
+        deployment records are requested concurrently and gathered into a
+        single typed table.
 
-            # Cruise IDs of the deployment and recover cruises
-            deployCruiseInfo = deployment.get("deployCruiseInfo")
-            recoverCruiseInfo = deployment.get("recoverCruiseInfo")
-            if deployCruiseInfo is not None:
-                deployID = deployCruiseInfo["uniqueCruiseIdentifier"]
-            else:
-                deployID = None
-            if recoverCruiseInfo is not None:
-                recoverID = recoverCruiseInfo["uniqueCruiseIdentifier"]
-            else:
-                recoverID = None
+        Args:
+            refdes_list (list): The reference designators of the instruments
+                for which to request deployment information.
+            deploy_num (str): Optional to include a specific deployment number.
+                Otherwise defaults to -1 which is all deployments.
+            max_workers (int): maximum number of concurrent requests
 
-            # Put the data into a pandas dataframe
-            data = np.array([[deploymentNumber, lat, lon, depth, startTime,
-                              stopTime, deployID, recoverID]])
-            columns = ["deploymentNumber", "latitude", "longitude", "depth",
-                       "deployStart", "deployEnd", "deployCruise",
-                       "recoverCruise"]
-            df = pd.DataFrame(data=data, columns=columns)
+        Returns:
+            results (pandas.DataFrame): A table of the deployment information
+                indexed by reference designator and deployment number, with
+                float latitude, longitude, and depth, datetime deployment
+                start and end, and the cruise IDs for the deployment and
+                recovery.
+        """
+        def request(refdes):
+            array, node, instrument = refdes.split("-", 2)
+            deploy_url = "/".join((self.urls["deploy"], array, node,
+                                   instrument, deploy_num))
+            return self._get_api(deploy_url)
+
+        # Request the deployments concurrently, keeping the order of refdes
+        refdes_list = list(dict.fromkeys(refdes_list))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(request, refdes_list))
 
-            #
-            results = results.append(df)
+        # Gather all of the records into one set of columns
+        columns = None
+        for refdes, deployments in zip(refdes_list, responses):
+            columns = self._parse_deployments(deployments, refdes, columns)
+        if columns is None:
+            columns = self._parse_deployments([], None)
+
+        results = self._deployments_frame(columns)
+        results = results.set_index(["refdes", "deploymentNumber"])
+        results = results.sort_index()
 
         return results
 
+    @timed("ooinet.get_vocab")
     def get_vocab(self, refdes):
         """
         Return the OOI vocabulary for a given url endpoint. The vocab results
@@ -196,18 +475,19 @@ class OOINet():
         data = self._get_api(vocab_url)
 
         # Put the returned vocab data into a pandas dataframe
-        vocab = pd.DataFrame()
-        vocab = vocab.append(data)
+        vocab = pd.DataFrame(data)
 
         # Finally, return the results
         return vocab
 
-    def get_datasets(self, search_url, datasets=pd.DataFrame(), **kwargs):
-        """Search OOINet for available datasets for a url."""
+    def _expand_node(self, search_url):
+        """
+        Expand a single node of the OOINet sensor inventory tree. Returns the
+        urls of the child nodes, or the dataset row if the node is a leaf
+        (i.e. a reference designator).
+        """
         # Check if the method is attached to the url
         flag = ("inv" == search_url.split("/")[-4])
-        # inst = re.search("[0-9]{2}-[023A-Z]{6}[0-9]{3}", search_url)
-        # inst = re.search("[0-9]{2}-", search_url)
 
         # This means you are at the end-point
         if flag is True:
@@ -220,33 +500,119 @@ class OOINet():
                                    instrument))
             deployments = self._get_api(deploy_url)
 
-            # Put the data into a dictionary
-            info = pd.DataFrame(data=np.array([[array, node, instrument,
-                                                refdes, search_url, deployments]]),
-                                columns=["array", "node", "instrument",
-                                         "refdes", "url", "deployments"])
-            # add the dictionary to the dataframe
-            datasets = datasets.append(info, ignore_index=True)
+            row = {
+                "array": array,
+                "node": node,
+                "instrument": instrument,
+                "refdes": refdes,
+                "url": search_url,
+                "deployments": deployments
+            }
+            return [], row
 
         else:
             endpoints = self._get_api(search_url)
+            children = ["/".join((search_url, endpoint))
+                        for endpoint in endpoints]
+            return children, None
+
+    def _save_checkpoint(self, checkpoint, search_url, pending, rows):
+        """Atomically write the state of an inventory crawl to disk."""
+        state = {
+            "search_url": search_url,
+            "pending": pending,
+            "rows": rows
+        }
+        tmp_file = checkpoint + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, checkpoint)
+
+    @timed("ooinet.get_datasets")
+    def get_datasets(self, search_url, datasets=None, max_workers=8,
+                     checkpoint=None, checkpoint_interval=50, **kwargs):
+        """
+        Search OOINet for available datasets for a url. The sensor inventory
+        tree is crawled breadth-first, with each level of the tree expanded
+        concurrently by a bounded pool of workers.
 
-            while len(endpoints) > 0:
-
-                # Get one endpoint
-                new_endpoint = endpoints.pop()
-
-                # Build the new request url
-                new_search_url = "/".join((search_url, new_endpoint))
+            Args:
+                search_url (str): the OOINet sensor inventory url at which to
+                    start the crawl
+                datasets (pandas.DataFrame): Optional. Datasets to prepend to
+                    the results of the crawl.
+                max_workers (int): maximum number of concurrent requests
+                checkpoint (str): Optional. Path to a json file in which the
+                    progress of the crawl is saved. If the file exists from
+                    an interrupted crawl of the same url, the crawl resumes
+                    from it. The file is removed once the crawl finishes.
+                checkpoint_interval (int): number of expanded nodes between
+                    writes of the checkpoint file
 
-                # Get the datasets for the new given endpoint
-                datasets = self.get_datasets(new_search_url, datasets)
+            Returns:
+                datasets (pandas.DataFrame): a table of the array, node,
+                    instrument, refdes, url, and deployments for each of the
+                    reference designators found under the search url
+        """
+        columns = ["array", "node", "instrument", "refdes", "url",
+                   "deployments"]
+
+        # Gather the leaf rows in a columnar buffer and the nodes which still
+        # need to be expanded
+        rows = {column: [] for column in columns}
+        pending = [search_url]
+
+        # Resume from a previous crawl of the same url if available
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            if state.get("search_url") == search_url:
+                rows = state["rows"]
+                pending = state["pending"]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while len(pending) > 0:
+                # Expand the current level of the tree concurrently
+                futures = {executor.submit(self._expand_node, url): url
+                           for url in pending}
+                remaining = set(pending)
+                next_level = []
+                for count, future in enumerate(as_completed(futures), 1):
+                    children, row = future.result()
+                    if row is not None:
+                        for column in columns:
+                            rows[column].append(row[column])
+                    next_level.extend(children)
+                    remaining.discard(futures[future])
+
+                    # Periodically save the progress of the crawl
+                    if checkpoint is not None and \
+                            count % checkpoint_interval == 0:
+                        self._save_checkpoint(checkpoint, search_url,
+                                              sorted(remaining) + next_level,
+                                              rows)
+
+                pending = sorted(next_level)
+                if checkpoint is not None:
+                    self._save_checkpoint(checkpoint, search_url, pending,
+                                          rows)
+
+        # The crawl finished, so the checkpoint is no longer needed
+        if checkpoint is not None and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        # Build a single dataframe from the columnar buffer
+        results = pd.DataFrame(rows, columns=columns)
+        results = results.sort_values(by="refdes").reset_index(drop=True)
+        if datasets is not None:
+            results = pd.concat([datasets, results], ignore_index=True)
 
-        # Once recursion is done, return the datasets
-        return datasets
+        return results
 
+    @timed("ooinet.search_datasets")
     def search_datasets(self, array=None, node=None, instrument=None,
-                        English_names=False):
+                        English_names=False, max_workers=8, checkpoint=None,
+                        index=None):
         """
         Wrapper around get_datasets to make the construction of the
         url simpler. Eventual goal is to use this as a search tool.
@@ -260,13 +626,23 @@ class OOINet():
                     particular instrument type to search for (e.g. CTD)
                 English_names (bool): Set to True if the descriptive names
                     associated with the given array/node/instrument are wanted.
+                max_workers (int): maximum number of concurrent requests used
+                    to crawl the sensor inventory
+                checkpoint (str): Optional. Path to a json file used to save
+                    and resume the progress of the crawl.
+                index (InventoryIndex): Optional. A local inventory index to
+                    search instead of crawling OOINet.
 
             Returns:
                 datasets (pandas.DataFrame): A dataframe of all the OOI
                     datasets which match the given search terms. If no search
                     terms are entered, will return every dataset available in
-                    OOINet (slow).
+                    OOINet (slow, unless searching an index).
         """
+        # Answer the search from the local index if one is given
+        if index is not None:
+            return index.search(array=array, node=node, instrument=instrument,
+                                English_names=English_names)
 
         # Build the request url
         dataset_url = f'{self.urls["data"]}/{array}/{node}/{instrument}'
@@ -276,18 +652,18 @@ class OOINet():
 
         print(dataset_url)
         # Get the datasets
-        datasets = self.get_datasets(dataset_url)
+        datasets = self.get_datasets(dataset_url, max_workers=max_workers,
+                                     checkpoint=checkpoint)
 
         # Now, it node is not None, can filter on that
         if node is not None:
-            mask = datasets["node"].apply(lambda x: True if node
-                                          in x else False)
+            mask = datasets["node"].str.contains(node, regex=False)
             datasets = datasets[mask]
 
         # If instrument is not None
         if instrument is not None:
-            mask = datasets["instrument"].apply(lambda x: True if instrument
-                                                in x else False)
+            mask = datasets["instrument"].str.contains(instrument,
+                                                       regex=False)
             datasets = datasets[mask]
 
         # Check if they want the English names for the associated datasets
@@ -299,18 +675,21 @@ class OOINet():
                 "instrument_name": []
             }
 
-            # Iterate through the given reference designators
-            for refdes in datasets["refdes"]:
-                # Request the vocab for the given reference designator
-                refdes_vocab = OOINet.get_vocab(refdes)
+            # Request the vocab for the given reference designators
+            refdes_list = list(datasets["refdes"])
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                refdes_vocabs = list(executor.map(self.get_vocab,
+                                                  refdes_list))
 
+            # Iterate through the given reference designators
+            for refdes, refdes_vocab in zip(refdes_list, refdes_vocabs):
                 # Check if it returns an empty dataframe - then fill with NaNs
                 if len(refdes_vocab) == 0:
                     vocab["refdes"].append(refdes)
                     vocab["array_name"].append(None)
                     vocab["node_name"].append(None)
-                    vocab["instrument_name"].append(
-                        refdes_vocab["instrument"].iloc[0])
+                    vocab["instrument_name"].append(None)
+                    continue
 
                 # Parse the refdes-specific vocab
                 vocab["refdes"].append(refdes)
@@ -331,6 +710,7 @@ class OOINet():
 
         return datasets
 
+    @timed("ooinet.get_datastreams")
     def get_datastreams(self, refdes):
         """Retrieve methods and data streams for a reference designator."""
         # Build the url
@@ -339,18 +719,19 @@ class OOINet():
 
         # Build a table linking the reference designators, methods, and data
         # streams
-        stream_df = pd.DataFrame(columns=["refdes", "method", "stream"])
+        rows = []
         methods = self._get_api(method_url)
         for method in methods:
             if "bad" in method:
                 continue
             stream_url = "/".join((method_url, method))
             streams = self._get_api(stream_url)
-            stream_df = stream_df.append({
+            rows.append({
                 "refdes": refdes,
                 "method": method,
                 "stream": streams
-            }, ignore_index=True)
+            })
+        stream_df = pd.DataFrame(rows, columns=["refdes", "method", "stream"])
 
         # Expand so that each row of the dataframe is unique
         stream_df = stream_df.explode('stream').reset_index(drop=True)
@@ -358,14 +739,26 @@ class OOINet():
         # Return the results
         return stream_df
 
-    def get_parameter_data_levels(self, metadata):
+    def _get_data_level(self, pdId):
+        """Request the data level of a parameter id from preload."""
+        # Build the preload url
+        preload_url = "/".join((self.urls["preload"], pdId.strip("PD")))
+        # Query the preload data
+        preload_data = self._get_api(preload_url)
+        return preload_data.get("data_level")
+
+    @timed("ooinet.get_parameter_data_levels")
+    def get_parameter_data_levels(self, metadata, max_workers=8):
         """
         Get the data levels associated with the parameters for a given
-        reference designator.
+        reference designator. Data levels are looked up in the parameter
+        registry, and only unknown parameter ids are requested from preload.
 
             Args:
                 metadata (pandas.DataFrame): a dataframe which contains the
                     metadata for a given reference designator.
+                max_workers (int): maximum number of concurrent requests for
+                    unknown parameter ids
 
             Returns:
                 pid_dict (dict): a dictionary with the data levels for each
@@ -373,15 +766,8 @@ class OOINet():
         """
 
         pdIds = np.unique(metadata["pdId"])
-        pid_dict = {}
-        for pid in pdIds:
-            # Build the preload url
-            preload_url = "/".join((self.urls["preload"], pid.strip("PD")))
-            # Query the preload data
-            preload_data = self._get_api(preload_url)
-            data_level = preload_data.get("data_level")
-            # Update the results dictionary
-            pid_dict.update({pid: data_level})
+        pid_dict = self.parameters.resolve(pdIds, self._get_data_level,
+                                           max_workers=max_workers)
 
         return pid_dict
 
@@ -394,9 +780,34 @@ class OOINet():
         else:
             return False
 
+    @timed("ooinet.filter_data_levels")
+    def filter_data_levels(self, metadata, levels=[1]):
+        """
+        Filter the metadata of a reference designator for the parameters
+        with the given data levels.
+
+            Args:
+                metadata (pandas.DataFrame): a dataframe which contains the
+                    metadata for a given reference designator.
+                levels (list): the data levels to keep, e.g. [1, 2] for the
+                    L1 and L2 data products
+
+            Returns:
+                metadata (pandas.DataFrame): the rows of the metadata whose
+                    parameters have one of the given data levels
+        """
+        pid_dict = self.get_parameter_data_levels(metadata)
+        mask = metadata["pdId"].map(pid_dict).isin(levels)
+        return metadata[mask]
+
+    @timed("ooinet.get_thredds_url")
     def get_thredds_url(self, refdes, method, stream, **kwargs):
         """
         Return the url for the THREDDS server for the desired dataset(s).
+        An outstanding or completed request for the same stream and
+        parameters whose window covers the requested one is reused instead
+        of submitting a new request, so its THREDDS catalog may hold data
+        outside the window: load it with the same beginDT and endDT.
 
             Args:
                 refdes (str): reference designator for the instrument
@@ -427,19 +838,38 @@ class OOINet():
                                      instrument, method, stream))
 
         # Ensure proper datetime format for the request
-        if 'beginDT' in kwargs.keys():
-            kwargs['beginDT'] = pd.to_datetime(kwargs['beginDT']).strftime(
-                '%Y-%m-%dT%H:%M:%S.%fZ')
-        if 'endDT' in kwargs.keys():
-            kwargs['endDT'] = pd.to_datetime(kwargs['endDT']).strftime(
-                '%Y-%m-%dT%H:%M:%S.%fZ')
+        window = {}
+        for key in ['beginDT', 'endDT']:
+            if key in kwargs.keys():
+                window[key] = to_datetime64(kwargs[key])
+                kwargs[key] = str(datetime64_to_iso(window[key]))
 
         # Build the query
         params = kwargs
 
+        # Reuse a covering request, or wait for one which is in flight
+        job_key = (data_request_url, tuple(sorted(
+            (key, str(value)) for key, value in params.items()
+            if key not in window)))
+        job, owner = self.jobs.claim(job_key, window.get('beginDT'),
+                                     window.get('endDT'))
+        if not owner:
+            get_metrics().count("cache_requests", cache="jobs", result="hit")
+            return job.result()
+        get_metrics().count("cache_requests", cache="jobs", result="miss")
+
+        try:
+            thredds_url = self._submit_data_request(data_request_url, params)
+        except Exception as exc:
+            self.jobs.fail(job, exc)
+            raise
+        self.jobs.complete(job, thredds_url)
+        return thredds_url
+
+    def _submit_data_request(self, data_request_url, params):
+        """Submit an asynchronous data request and return its THREDDS url."""
         # Request the data
-        r = requests.get(data_request_url, params=params, auth=(self.username,
-                                                                self.token))
+        r = self._request(data_request_url, params=params)
         if r.status_code == 200:
             data_urls = r.json()
         else:
@@ -454,55 +884,146 @@ class OOINet():
 
         return thredds_url
 
-    def _get_elements(self, url, tag_name, attribute_name):
-        """Get elements from an XML file."""
-        usock = urlopen(url)
-        xmldoc = minidom.parse(usock)
-        usock.close()
-        tags = xmldoc.getElementsByTagName(tag_name)
-        attributes = []
-        for tag in tags:
-            attribute = tag.getAttribute(attribute_name)
-            attributes.append(attribute)
-        return attributes
+    @timed("ooinet.get_catalog_entries")
+    def get_catalog_entries(self, catalog_url):
+        """
+        Get the dataset entries of a THREDDS catalog. The catalog xml is
+        parsed incrementally as it streams in, and the entries of the most
+        recently used catalogs are cached by catalog url and Last-Modified,
+        so an unchanged catalog is answered with a conditional request and
+        no parsing.
+
+            Args:
+                catalog_url (str): the url of the THREDDS catalog xml
+
+            Returns:
+                entries (list): a dictionary for each dataset with its urlPath
+                    ("path"), size in bytes ("size"), and modification time
+                    ("modified")
+        """
+        with self._catalogs_lock:
+            cached = self._catalogs.get(catalog_url)
+            if cached is not None:
+                self._catalogs.move_to_end(catalog_url)
+        headers = {}
+        if cached is not None and cached["last_modified"] is not None:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        with self._request(catalog_url, auth=False, headers=headers,
+                           stream=True) as r:
+            if r.status_code == requests.codes.not_modified:
+                get_metrics().count("cache_requests", cache="catalog",
+                                    result="hit")
+                return cached["entries"]
+            if cached is not None:
+                get_metrics().count("cache_requests", cache="catalog",
+                                    result="miss")
+            r.raise_for_status()
+            r.raw.decode_content = True
+            entries = list(iter_catalog(r.raw))
+            last_modified = r.headers.get("Last-Modified")
+
+        # Keep the most recently used catalogs
+        with self._catalogs_lock:
+            self._catalogs[catalog_url] = {
+                "last_modified": last_modified,
+                "entries": entries
+            }
+            self._catalogs.move_to_end(catalog_url)
+            while len(self._catalogs) > self.CATALOG_CACHE_SIZE:
+                self._catalogs.popitem(last=False)
+        return entries
+
+    def _check_thredds_status(self, status_url):
+        """
+        Check if the status file of a THREDDS data request exists. Connection
+        errors and timeouts are treated as not finished yet, so the poller
+        checks again until the request times out.
+        """
+        try:
+            status = self._request(status_url, auth=False,
+                                   session=self.status_session,
+                                   timeout=self.STATUS_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            return False
+        return status.status_code == requests.codes.ok
+
+    @property
+    def poller(self):
+        """The shared poller which watches outstanding THREDDS requests."""
+        with self._poller_lock:
+            if self._poller is None:
+                self._poller = ThreddsPoller(self._check_thredds_status)
+        return self._poller
+
+    def poll_thredds_job(self, thredds_url, timeout=10*60, callback=None):
+        """
+        Watch an asynchronous THREDDS data request until it is finished.
+
+            Args:
+                thredds_url (str): the THREDDS server url for the
+                    requested data stream
+                timeout (float): seconds after which to give up on the request
+                callback (callable): Optional. Called after each status check
+                    with the status url, number of checks, elapsed seconds,
+                    and whether the request is finished.
+
+            Returns:
+                future (concurrent.futures.Future): resolves once the request
+                    is finished, or raises a ThreddsTimeoutError
+        """
+        # Parse out the dataset_id from the thredds url
+        dataset_id = re.findall(r'(ooi/.*)/catalog', thredds_url)[0]
+        status_url = thredds_url + '?dataset=' + dataset_id + '/status.txt'
+        future = self.poller.submit(status_url, callback=callback,
+                                    timeout=timeout)
+
+        # Don't hand out a request which never finished again
+        def finished(future):
+            if future.cancelled() or future.exception() is not None:
+                self.jobs.discard(thredds_url)
+
+        future.add_done_callback(finished)
+        return future
 
-    def get_thredds_catalog(self, thredds_url):
+    @timed("ooinet.get_thredds_catalog")
+    def get_thredds_catalog(self, thredds_url, timeout=10*60, callback=None):
         """
         Get the dataset catalog for the requested data stream.
 
             Args:
                 thredds_url (str): the THREDDS server url for the
                     requested data stream
+                timeout (float): seconds to wait for the request to finish
+                callback (callable): Optional. Progress callback passed to
+                    poll_thredds_job.
 
             Returns:
                 catalog (list): the THREDDS catalog of datasets for
                     the requested data stream
+
+            Raises:
+                ThreddsTimeoutError: if the request doesn't finish in time
         """
         # ==========================================================
         # Parse out the dataset_id from the thredds url
-        server_url = 'https://opendap.oceanobservatories.org/thredds/'
+        server_url = self.thredds_server
         dataset_id = re.findall(r'(ooi/.*)/catalog', thredds_url)[0]
 
-        # Check the status of the request until the datasets are ready
-        # Will timeout if request takes longer than 10 mins
-        status_url = thredds_url + '?dataset=' + dataset_id + '/status.txt'
-        status = requests.get(status_url)
-        start_time = time.time()
-        while status.status_code != requests.codes.ok:
-            elapsed_time = time.time() - start_time
-            status = requests.get(status_url)
-            if elapsed_time > 10*60:
-                print(f'Request time out for {thredds_url}')
-                return None
-            time.sleep(5)
+        # Wait on the status of the request until the datasets are ready
+        with get_metrics().span("ooinet.thredds_job_wait"):
+            self.poll_thredds_job(thredds_url, timeout=timeout,
+                                  callback=callback).result()
 
         # Parse the datasets from the catalog for the requests url
         catalog_url = server_url + dataset_id + '/catalog.xml'
-        catalog = self._get_elements(catalog_url, 'dataset', 'urlPath')
+        catalog = [entry["path"] for entry in
+                   self.get_catalog_entries(catalog_url)]
 
         return catalog
 
-    def parse_catalog(self, catalog, exclude=[]):
+    @timed("ooinet.parse_catalog")
+    def parse_catalog(self, catalog, exclude=[], include=None):
         """
         Parses the THREDDS catalog for the netCDF files. The exclude
         argument takes in a list of strings to check a given catalog
@@ -512,33 +1033,122 @@ class OOINet():
             catalog (list): the THREDDS catalog of datasets for
                 the requested data stream
             exclude (list): keywords to filter files out of the THEDDS catalog
+            include (list): Optional. Keywords of which at least one must be
+                in a file for it to be kept.
 
         Returns:
             datasets (list): a list of netCDF datasets which contain the
                 associated .nc datasets
         """
-        datasets = [citem for citem in catalog if citem.endswith('.nc')]
-        if type(exclude) is not list:
-            raise ValueError('arg exclude must be a list')
-        for ex in exclude:
-            if type(ex) is not str:
-                raise ValueError(f'Element {ex} of exclude must be a string.')
-            datasets = [dset for dset in datasets if ex not in dset]
+        keep = compile_filter(include=include, exclude=exclude)
+        datasets = [citem for citem in catalog
+                    if citem.endswith('.nc') and keep(citem)]
         return datasets
 
-    def download_netCDF_files(self, datasets, save_dir=None):
+    def _download_file(self, file_url, path, chunk_size=1024**2):
+        """
+        Download a single file from the THREDDS file server. Skips the file
+        if it is already present with the same size and modification time
+        as on the server, and resumes a partial download using an http Range
+        request if the file on the server hasn't changed since the partial
+        download started (checked with the Last-Modified time saved next to
+        it, and with If-Range). The file is written to a temporary name and
+        renamed once complete.
+
+            Returns:
+                status (str): one of "skipped", "resumed", or "downloaded"
+                size (int): the size of the file in bytes
+        """
+        # Get the size and modification time of the file on the server
+        head = self._request(file_url, auth=False, method="HEAD",
+                             allow_redirects=True)
+        head.raise_for_status()
+        size = head.headers.get("Content-Length")
+        size = int(size) if size is not None else None
+        last_modified = head.headers.get("Last-Modified")
+        modified = None
+        if last_modified is not None:
+            modified = parsedate_to_datetime(last_modified).timestamp()
+
+        # Skip the file if the local copy is unchanged
+        if os.path.exists(path) and size is not None:
+            stat = os.stat(path)
+            if stat.st_size == size and (modified is None or
+                                         stat.st_mtime >= modified):
+                return "skipped", size
+
+        # Resume from a partial download if the server supports it and the
+        # file hasn't changed since the partial download started
+        part_path = path + ".part"
+        modified_path = part_path + ".modified"
+        saved_modified = None
+        if os.path.exists(modified_path):
+            with open(modified_path) as f:
+                saved_modified = f.read()
+        offset = 0
+        headers = {}
+        if os.path.exists(part_path) and \
+                head.headers.get("Accept-Ranges") == "bytes" and \
+                last_modified is not None and saved_modified == last_modified:
+            offset = os.path.getsize(part_path)
+            if size is not None and offset < size:
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = last_modified
+            else:
+                offset = 0
+
+        with self._request(file_url, auth=False, headers=headers,
+                           stream=True) as r:
+            r.raise_for_status()
+            # The server ignored the range, or the file changed, and it sent
+            # the whole file
+            if r.status_code != 206:
+                offset = 0
+            if offset == 0:
+                # Save the version of the file the partial download is of
+                if last_modified is not None:
+                    with open(modified_path, "w") as f:
+                        f.write(last_modified)
+                elif os.path.exists(modified_path):
+                    os.remove(modified_path)
+            mode = "ab" if offset > 0 else "wb"
+            with open(part_path, mode) as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+
+        # Atomically move the completed file into place, keeping the
+        # modification time of the server copy
+        os.replace(part_path, path)
+        if os.path.exists(modified_path):
+            os.remove(modified_path)
+        if modified is not None:
+            os.utime(path, (modified, modified))
+
+        status = "resumed" if offset > 0 else "downloaded"
+        return status, os.path.getsize(path)
+
+    @timed("ooinet.download_netCDF_files")
+    def download_netCDF_files(self, datasets, save_dir=None, max_workers=4):
         """
         Download netCDF files for given netCDF datasets. If no path
         is specified for the save directory, will download the files to
-        the current working directory.
+        the current working directory. Files are downloaded concurrently,
+        files which are already present and unchanged are skipped, and
+        interrupted downloads are resumed.
 
             Args:
                 datasets (list): the netCDF datasets to download
                 save_dir (str): the path to the directory in which to save
                     the downloaded netCDF files
+                max_workers (int): the number of concurrent downloads
+
+            Returns:
+                manifest (pandas.DataFrame): a table of the dataset, local
+                    path, status ("downloaded", "resumed", "skipped", or
+                    "failed"), size in bytes, and error of each file
         """
         # Specify the server url
-        server_url = 'https://opendap.oceanobservatories.org/thredds/'
+        server_url = self.thredds_server
 
         # Specify and make the relevant save directory
         if save_dir is not None:
@@ -548,23 +1158,107 @@ class OOINet():
         else:
             save_dir = os.getcwd()
 
-        # Download and save the netCDF files from the HTTPServer
-        # to the save directory
-        count = 0
+        # Check that the datasets are netCDF
         for dset in datasets:
-            # Check that the datasets are netCDF
             if not dset.endswith('.nc'):
                 raise ValueError(f'Dataset {dset} not netCDF.')
-            count += 1
-            file_url = server_url + 'fileServer/' + dset
-            filename = file_url.split('/')[-1]
-            print(f'Downloading file {count} of {len(datasets)}: {dset} \n')
-            a = urlretrieve(file_url, '/'.join((save_dir, filename)))
 
-    def load_netCDF_files(self, netCDF_datasets):
-        """Open the netCDF files directly from the THREDDS opendap server."""
+        # Download and save the netCDF files from the HTTPServer
+        # to the save directory
+        manifest = {
+            "dataset": [],
+            "path": [],
+            "status": [],
+            "size": [],
+            "error": []
+        }
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for dset in datasets:
+                file_url = server_url + 'fileServer/' + dset
+                filename = file_url.split('/')[-1]
+                path = '/'.join((save_dir, filename))
+                future = executor.submit(self._download_file, file_url, path)
+                futures[future] = (dset, path)
+
+            for count, future in enumerate(as_completed(futures), 1):
+                dset, path = futures[future]
+                try:
+                    status, size = future.result()
+                    error = None
+                except Exception as exc:
+                    status, size, error = "failed", None, str(exc)
+                print(f'File {count} of {len(datasets)} {status}: {dset}')
+                get_metrics().count("files", status=status)
+                manifest["dataset"].append(dset)
+                manifest["path"].append(path)
+                manifest["status"].append(status)
+                manifest["size"].append(size)
+                manifest["error"].append(error)
+
+        return pd.DataFrame(manifest)
+
+    def _subset_netCDF(self, ds, variables=None, beginDT=None, endDT=None):
+        """
+        Lazily subset a single netCDF dataset (with obs as the dimension) to
+        the given variables and time range. Only the time variable is read
+        to find the range, and the range is selected as one contiguous slice
+        of obs, so only the needed variables and indices are pulled over
+        OpenDAP.
+        """
+        if variables is not None:
+            keep = [var for var in list(variables) + ["time"]
+                    if var in ds.variables]
+            ds = ds[list(dict.fromkeys(keep))]
+
+        if beginDT is not None or endDT is not None:
+            times = ds["time"].values
+            mask = np.ones(times.shape, dtype=bool)
+            if beginDT is not None:
+                mask &= times >= to_datetime64(beginDT)
+            if endDT is not None:
+                mask &= times <= to_datetime64(endDT)
+            index = np.flatnonzero(mask)
+            if len(index) > 0:
+                ds = ds.isel(obs=slice(index[0], index[-1] + 1))
+            else:
+                ds = ds.isel(obs=slice(0, 0))
+
+        return ds
+
+    @timed("ooinet.load_netCDF_files")
+    def load_netCDF_files(self, netCDF_datasets, variables=None, beginDT=None,
+                          endDT=None, chunk_size=100000, parallel=True,
+                          derived=None):
+        """
+        Open the netCDF files directly from the THREDDS opendap server.
+
+            Args:
+                netCDF_datasets (list): the netCDF datasets to open
+                variables (list): Optional. The variables to load. Defaults to
+                    all of the variables.
+                beginDT (str): Optional. Only load data after this date.
+                endDT (str): Optional. Only load data before this date.
+                chunk_size (int): the number of records per dask chunk along
+                    the obs dimension
+                parallel (bool): Set to False to open the files one at a time
+                    rather than in parallel.
+                derived (list): Optional. Names of derived variables (see
+                    derived.py) to add, e.g. ["wind_speed"]. Their inputs are
+                    loaded even if not in variables.
+
+            Returns:
+                ds (xarray.Dataset): the opened datasets, with time as the
+                    main dimension
+        """
+        import xarray as xr
+
+        # Load the inputs of the derived variables
+        if derived and variables is not None:
+            variables = list(variables) + DERIVED.inputs(derived)
+
         # Get the OpenDAP server
-        opendap_url = "https://opendap.oceanobservatories.org/thredds/dodsC"
+        opendap_url = self.thredds_server + "dodsC"
 
         # Add the OpenDAP url to the netCDF dataset names
         netCDF_datasets = ["/".join((opendap_url, dset)) for dset in
@@ -575,17 +1269,179 @@ class OOINet():
         # data mapping. Requires appending #fillmismatch to open the data
         netCDF_datasets = [dset+"#fillmismatch" for dset in netCDF_datasets]
 
+        # Push the variable and time range selection down to each file
+        def preprocess(ds):
+            return self._subset_netCDF(ds, variables=variables,
+                                       beginDT=beginDT, endDT=endDT)
+
         # Open the datasets into an xarray dataset, make time the main
-        # dimension, and sort
-        with xr.open_mfdataset(netCDF_datasets) as ds:
+        # dimension, and sort if the files aren't already in order. The obs
+        # index restarts at zero in every file, so the files can't be
+        # combined by their coordinates and are concatenated along obs.
+        with xr.open_mfdataset(netCDF_datasets, preprocess=preprocess,
+                               chunks={"obs": chunk_size},
+                               combine="nested", concat_dim="obs",
+                               data_vars="minimal", coords="minimal",
+                               compat="override",
+                               parallel=parallel) as ds:
             ds = ds.swap_dims({"obs": "time"})
-            ds = ds.sortby("time")
+            if not ds.get_index("time").is_monotonic_increasing:
+                ds = ds.sortby("time")
+
+        # Add in the English name of the dataset and the (lazily evaluated)
+        # derived variables
+        ds = self._add_location_name(ds)
+        ds = DERIVED.derive(ds, derived)
+
+        # Return the dataset
+        return ds
 
-        # Add in the English name of the dataset
+    def _add_location_name(self, ds):
+        """Add the English name of the dataset location to its attributes."""
         refdes = "-".join(ds.attrs["id"].split("-")[:4])
         vocab = self.get_vocab(refdes)
         ds.attrs["Location_name"] = " ".join((vocab["tocL1"].iloc[0],
                                               vocab["tocL2"].iloc[0],
                                               vocab["tocL3"].iloc[0]))
-        # Return the dataset
+        return ds
+
+    def _fetch_netCDF_file(self, file_url, budget, chunk_size=1024**2):
+        """
+        Fetch a netCDF file from the THREDDS file server into memory if it
+        fits within the remaining memory budget, otherwise into a temporary
+        file on disk.
+
+            Returns:
+                content (bytes or str): the file contents, or the path to the
+                    temporary file
+                size (int): the number of bytes reserved from the budget
+        """
+        with self._request(file_url, auth=False, stream=True) as r:
+            r.raise_for_status()
+            size = r.headers.get("Content-Length")
+            size = int(size) if size is not None else None
+
+            # Reserve the memory for the file, if there is room
+            reserved = 0
+            if size is not None:
+                with budget["lock"]:
+                    if budget["available"] >= size:
+                        budget["available"] -= size
+                        reserved = size
+
+            if reserved > 0:
+                content = bytearray()
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    content.extend(chunk)
+                return bytes(content), reserved
+
+            # Otherwise spill the file to disk
+            with tempfile.NamedTemporaryFile(suffix=".nc",
+                                             delete=False) as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+            return f.name, 0
+
+    def _open_netCDF_file(self, content, name, variables=None, beginDT=None,
+                          endDT=None):
+        """
+        Open a netCDF file from bytes in memory or a temporary file, subset
+        it, and load it into memory.
+        """
+        import xarray as xr
+
+        if isinstance(content, bytes):
+            import netCDF4
+            from xarray.backends.locks import (HDF5_LOCK, NETCDFC_LOCK,
+                                               combine_locks)
+            # The HDF5 library isn't thread-safe, so open the file under the
+            # same lock xarray holds when reading it
+            lock = combine_locks([HDF5_LOCK, NETCDFC_LOCK])
+            with lock:
+                nc = netCDF4.Dataset(name, memory=content)
+            store = xr.backends.NetCDF4DataStore(nc, lock=lock)
+            with xr.open_dataset(store) as ds:
+                ds = self._subset_netCDF(ds, variables=variables,
+                                         beginDT=beginDT, endDT=endDT)
+                ds = ds.load()
+        else:
+            try:
+                with xr.open_dataset(content) as ds:
+                    ds = self._subset_netCDF(ds, variables=variables,
+                                             beginDT=beginDT, endDT=endDT)
+                    ds = ds.load()
+            finally:
+                os.remove(content)
+        return ds
+
+    @timed("ooinet.stream_netCDF_files")
+    def stream_netCDF_files(self, netCDF_datasets, variables=None,
+                            beginDT=None, endDT=None, max_workers=4,
+                            memory_budget=512*1024**2, derived=None):
+        """
+        Load netCDF files from the THREDDS file server without writing them
+        to disk. Each file is fetched concurrently with a single http request
+        into memory and opened from the bytes. Files which don't fit in the
+        remaining memory budget are spilled to temporary files instead, which
+        are removed once loaded.
+
+            Args:
+                netCDF_datasets (list): the netCDF datasets to load
+                variables (list): Optional. The variables to load. Defaults to
+                    all of the variables.
+                beginDT (str): Optional. Only load data after this date.
+                endDT (str): Optional. Only load data before this date.
+                max_workers (int): the number of concurrent transfers
+                memory_budget (int): the maximum number of bytes of file
+                    contents to hold in memory at once
+                derived (list): Optional. Names of derived variables to add,
+                    as in load_netCDF_files.
+
+            Returns:
+                ds (xarray.Dataset): the loaded datasets, with time as the
+                    main dimension, as returned by load_netCDF_files
+        """
+        import xarray as xr
+
+        # Load the inputs of the derived variables
+        if derived and variables is not None:
+            variables = list(variables) + DERIVED.inputs(derived)
+
+        # Specify the server url
+        server_url = self.thredds_server
+
+        budget = {
+            "available": memory_budget,
+            "lock": threading.Lock()
+        }
+
+        def load(dset):
+            file_url = server_url + 'fileServer/' + dset
+            content, reserved = self._fetch_netCDF_file(file_url, budget)
+            try:
+                return self._open_netCDF_file(content, dset,
+                                              variables=variables,
+                                              beginDT=beginDT, endDT=endDT)
+            finally:
+                # Release the memory for the next files
+                del content
+                with budget["lock"]:
+                    budget["available"] += reserved
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            datasets = list(executor.map(load, netCDF_datasets))
+
+        # Combine the datasets, make time the main dimension, and sort if
+        # the files aren't already in order
+        ds = xr.concat(datasets, dim="obs", data_vars="minimal",
+                       coords="minimal", compat="override")
+        ds = ds.swap_dims({"obs": "time"})
+        if not ds.get_index("time").is_monotonic_increasing:
+            ds = ds.sortby("time")
+
+        # Add in the English name of the dataset and the (lazily evaluated)
+        # derived variables
+        ds = self._add_location_name(ds)
+        ds = DERIVED.derive(ds, derived)
+
         return ds